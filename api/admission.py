@@ -0,0 +1,325 @@
+"""Admission control and load shedding for the API.
+
+Requests pass three checks before reaching a route, cheapest first:
+
+1. Overload shedding: when event-loop lag or database pool wait time is over its threshold,
+   new work is refused with 503 instead of queueing behind work that is already late.
+2. Per-client token buckets: a client over its rate gets 429.
+3. Per-route concurrency limits: once a route has ``limit`` requests in flight, newcomers wait
+   at most ``ADMISSION_QUEUE_TIMEOUT_MS`` for a slot and are then refused with 503.
+
+Every refusal is immediate and carries ``Retry-After``, so clients back off instead of piling
+coroutines onto a slow Postgres or Temporal. A route slot is given back as soon as the response
+starts, so slow clients reading a streamed body (attachment downloads) don't hold it.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from starlette.routing import compile_path
+
+from profiler import LoopLagMonitor
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() not in ("0", "false", "no")
+# "METHOD /path/{param}=limit" pairs, comma-separated
+ADMISSION_ROUTE_LIMITS = os.getenv(
+    "ADMISSION_ROUTE_LIMITS",
+    "POST /api/requests=32,GET /api/requests=64,PATCH /api/requests/{id}=32,"
+    "PATCH /api/requests:bulk=4",
+)
+ADMISSION_DEFAULT_LIMIT = int(os.getenv("ADMISSION_DEFAULT_LIMIT", "128"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "50"))
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "20"))
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "40"))
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "250"))
+ADMISSION_MAX_POOL_WAIT_MS = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "1000"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Seconds for the pool wait average to halve with no new samples. Shed requests never reach
+# the pool, so without decay a high average would keep shedding forever.
+ADMISSION_POOL_WAIT_HALF_LIFE = float(os.getenv("ADMISSION_POOL_WAIT_HALF_LIFE", "2"))
+# Reverse proxies in front of the API that append to X-Forwarded-For; the default matches the
+# Container Apps ingress. 0 ignores the header and keys clients on the connection's peer
+# address, which behind a proxy puts every client in one bucket.
+ADMISSION_TRUSTED_PROXIES = int(os.getenv("ADMISSION_TRUSTED_PROXIES", "1"))
+ADMISSION_EXEMPT_PATHS = [
+    p for p in os.getenv("ADMISSION_EXEMPT_PATHS", "/healthz,/api/admin/profile").split(",") if p
+]
+
+
+def parse_route_limits(spec: str) -> List[Tuple[str, str, int]]:
+    limits = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        route, limit = item.rsplit("=", 1)
+        method, path = route.split(None, 1)
+        limits.append((method.upper(), path.strip(), int(limit)))
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+
+class ClientRateLimiter:
+    """Token bucket per client, refilled lazily; idle clients are evicted LRU-first."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = ADMISSION_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def acquire(self, client: str, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 on success or the seconds until a token is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.burst, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+
+class RouteLimiter:
+    """Bounded in-flight count for one route with a short wait for a free slot."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self, timeout: float) -> bool:
+        if self._semaphore.locked():
+            if timeout <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class PoolWaitTracker:
+    """Tracks how long requests wait for a database connection.
+
+    The signal is the larger of a moving average of completed waits and the age of the oldest
+    wait still in progress, so a stalled pool is noticed before anyone gets a connection. The
+    average halves every ``half_life`` seconds without samples, so once requests are shed and
+    stop measuring, it falls back under the threshold and traffic resumes.
+    """
+
+    def __init__(self, alpha: float = 0.2, half_life: float = ADMISSION_POOL_WAIT_HALF_LIFE):
+        self.alpha = alpha
+        self.half_life = half_life
+        self._average = 0.0
+        self._sampled_at = time.monotonic()
+        self._waiting: Dict[int, float] = {}
+        self._next_id = 0
+
+    @property
+    def average(self) -> float:
+        if self.half_life <= 0:
+            return self._average
+        idle = time.monotonic() - self._sampled_at
+        return self._average * 0.5 ** (idle / self.half_life)
+
+    @average.setter
+    def average(self, value: float):
+        self._average = value
+        self._sampled_at = time.monotonic()
+
+    @asynccontextmanager
+    async def measure(self):
+        wait_id = self._next_id
+        self._next_id += 1
+        started = time.monotonic()
+        self._waiting[wait_id] = started
+        try:
+            yield
+        finally:
+            del self._waiting[wait_id]
+            elapsed = time.monotonic() - started
+            average = self.average
+            self.average = average + self.alpha * (elapsed - average)
+
+    @property
+    def current(self) -> float:
+        # Ids grow with start time, so the first entry is the oldest wait
+        oldest = next(iter(self._waiting.values()), None)
+        in_progress = time.monotonic() - oldest if oldest is not None else 0.0
+        return max(self.average, in_progress)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        route_limits: str = ADMISSION_ROUTE_LIMITS,
+        default_limit: int = ADMISSION_DEFAULT_LIMIT,
+        queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS,
+        client_rate: float = ADMISSION_CLIENT_RATE,
+        client_burst: float = ADMISSION_CLIENT_BURST,
+        max_loop_lag_ms: float = ADMISSION_MAX_LOOP_LAG_MS,
+        max_pool_wait_ms: float = ADMISSION_MAX_POOL_WAIT_MS,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+        exempt_paths: Optional[List[str]] = None,
+        enabled: bool = ADMISSION_ENABLED,
+        trusted_proxies: int = ADMISSION_TRUSTED_PROXIES,
+    ):
+        self.enabled = enabled
+        self.trusted_proxies = trusted_proxies
+        self.routes: List[Tuple[str, Pattern, RouteLimiter]] = []
+        for method, path, limit in parse_route_limits(route_limits):
+            regex, _, _ = compile_path(path)
+            self.routes.append((method, regex, RouteLimiter(limit)))
+        self.default_route = RouteLimiter(default_limit)
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self.clients = ClientRateLimiter(client_rate, client_burst)
+        self.max_loop_lag = max_loop_lag_ms / 1000.0
+        self.max_pool_wait = max_pool_wait_ms / 1000.0
+        self.retry_after = retry_after
+        self.exempt_paths = set(ADMISSION_EXEMPT_PATHS if exempt_paths is None else exempt_paths)
+        self.loop_lag = LoopLagMonitor()
+        self.pool_wait = PoolWaitTracker()
+        self.shed_counts: Dict[str, int] = {"overload": 0, "rate": 0, "concurrency": 0}
+        self._warned_forwarded = False
+
+    def client_key(self, scope) -> str:
+        if self.trusted_proxies <= 0 and not self._warned_forwarded:
+            if any(name == b"x-forwarded-for" for name, _ in scope.get("headers", [])):
+                # Behind a proxy this rate-limits all clients as one; say so once
+                self._warned_forwarded = True
+                print(
+                    "Warning: ignoring X-Forwarded-For with ADMISSION_TRUSTED_PROXIES=0; "
+                    "every client behind the proxy shares one rate limit"
+                )
+        return _client_key(scope, self.trusted_proxies)
+
+    def route_for(self, method: str, path: str) -> RouteLimiter:
+        for route_method, regex, limiter in self.routes:
+            if route_method == method and regex.match(path):
+                return limiter
+        return self.default_route
+
+    def overloaded(self) -> Optional[str]:
+        if self.loop_lag.lag > self.max_loop_lag:
+            return f"event loop lag {self.loop_lag.lag * 1000:.0f}ms"
+        pool_wait = self.pool_wait.current
+        if pool_wait > self.max_pool_wait:
+            return f"database pool wait {pool_wait * 1000:.0f}ms"
+        return None
+
+
+def _client_key(scope, trusted_proxies: int = 0) -> str:
+    """The client address, from X-Forwarded-For only as far as ``trusted_proxies`` vouch for it.
+
+    Each trusted proxy appends the address it received the request from, so the client is the
+    ``trusted_proxies``-th entry from the right; anything left of that is client-supplied.
+    """
+    if trusted_proxies > 0:
+        forwarded: List[str] = []
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                forwarded.extend(a.strip() for a in value.decode("latin-1").split(","))
+        forwarded = [a for a in forwarded if a]
+        if forwarded:
+            return forwarded[-min(trusted_proxies, len(forwarded))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(retry_after).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    """Pure ASGI middleware applying an ``AdmissionController`` to HTTP requests."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        if (
+            scope["type"] != "http"
+            or not controller.enabled
+            or scope["method"] == "OPTIONS"
+            or scope["path"] in controller.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        reason = controller.overloaded()
+        if reason is not None:
+            controller.shed_counts["overload"] += 1
+            await _reject(send, 503, f"Service overloaded ({reason})", controller.retry_after)
+            return
+
+        wait = controller.clients.acquire(controller.client_key(scope))
+        if wait > 0:
+            controller.shed_counts["rate"] += 1
+            await _reject(send, 429, "Too many requests", max(1, math.ceil(wait)))
+            return
+
+        limiter = controller.route_for(scope["method"], scope["path"])
+        if not await limiter.acquire(controller.queue_timeout):
+            controller.shed_counts["concurrency"] += 1
+            await _reject(send, 503, "Too many concurrent requests", controller.retry_after)
+            return
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                limiter.release()
+
+        async def send_and_release(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
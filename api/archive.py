@@ -0,0 +1,132 @@
+"""Moves old resolved requests out of the hot ``requests`` table.
+
+``requests_archive`` is range-partitioned by ``created_at`` on Postgres, one partition per
+month, created on demand the first time a batch contains a row for that month. Each batch runs
+in its own short transaction:
+
+1. pick up to ``batch_size`` resolved requests last updated before the cutoff, oldest id
+   first, locking them with ``FOR UPDATE SKIP LOCKED`` so concurrent API writes are never
+   blocked for long and two archivers never contend;
+2. move their attachment rows to ``attachments_archive`` (the blobs stay where they are), then
+   copy the requests into the archive and delete them from ``requests``.
+
+The stats triggers on both tables cancel out, so ``/api/stats`` is unchanged by archival.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Set
+
+from sqlalchemy import String, cast, delete, select, text
+
+ARCHIVED_STATUS = "resolved"
+
+
+def _month_start(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(start: datetime) -> datetime:
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+async def ensure_month_partition(conn, archive, month: datetime):
+    """Create the archive partition holding ``month`` (Postgres only; a no-op elsewhere)."""
+    if conn.dialect.name != "postgresql":
+        return
+    start = _month_start(month)
+    end = _next_month(start)
+    await conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {archive.name}_{start:%Y_%m} PARTITION OF {archive.name} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+
+
+def _copy_columns(source, target):
+    return [c.name for c in source.c if c.name in target.c]
+
+
+async def archive_batch(
+    conn,
+    requests,
+    archive,
+    attachments,
+    attachments_archive,
+    cutoff: datetime,
+    batch_size: int,
+    months: Set[datetime],
+) -> int:
+    """Move one batch inside the caller's transaction; returns the number of rows moved.
+
+    ``months`` caches partitions already ensured by earlier batches of the same run.
+    """
+    candidates = (
+        select(requests.c.id, requests.c.created_at)
+        .where(
+            requests.c.status == ARCHIVED_STATUS,
+            requests.c.updated_at < cutoff,
+        )
+        .order_by(requests.c.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=requests)
+    )
+    rows = (await conn.execute(candidates)).all()
+    if not rows:
+        return 0
+    for month in {_month_start(row.created_at) for row in rows} - months:
+        await ensure_month_partition(conn, archive, month)
+        months.add(month)
+
+    ids = [row.id for row in rows]
+    # Attachments first: attachments.request_id references requests
+    moved_attachments = attachments.c.request_id.in_(ids)
+    copied = _copy_columns(attachments, attachments_archive)
+    await conn.execute(
+        attachments_archive.insert().from_select(
+            copied, select(*(attachments.c[name] for name in copied)).where(moved_attachments)
+        )
+    )
+    await conn.execute(delete(attachments).where(moved_attachments))
+    copied = _copy_columns(requests, archive)
+    source = [
+        cast(requests.c[name], String) if name == "status" else requests.c[name] for name in copied
+    ]
+    await conn.execute(
+        archive.insert().from_select(copied, select(*source).where(requests.c.id.in_(ids)))
+    )
+    await conn.execute(delete(requests).where(requests.c.id.in_(ids)))
+    return len(ids)
+
+
+async def archive_resolved(
+    engine,
+    requests,
+    archive,
+    attachments,
+    attachments_archive,
+    older_than: timedelta,
+    batch_size: int = 500,
+    pause: float = 0.0,
+    max_batches: int = 0,
+) -> Dict[str, int]:
+    """Archive resolved requests untouched for ``older_than``, one transaction per batch."""
+    cutoff = datetime.now(timezone.utc) - older_than
+    months: Set[datetime] = set()
+    moved = batches = 0
+    while not max_batches or batches < max_batches:
+        async with engine.begin() as conn:
+            count = await archive_batch(
+                conn, requests, archive, attachments, attachments_archive, cutoff, batch_size, months
+            )
+        moved += count
+        batches += 1
+        if count < batch_size:
+            break
+        if pause:
+            # Let replicas and autovacuum keep up between batches
+            await asyncio.sleep(pause)
+    return {"moved": moved, "batches": batches}
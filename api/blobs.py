@@ -0,0 +1,204 @@
+"""Attachment storage backends and HTTP helpers for serving attachment content.
+
+``BLOB_BACKEND`` picks the backend:
+
+- ``local`` (default): files under ``BLOB_ROOT``. Downloads are served with ``FileResponse``,
+  which answers Range/If-Range itself and, when the ASGI server offers the ``pathsend``
+  extension, hands the path to the server for zero-copy sendfile instead of reading the file
+  through Python.
+- ``azure``: blobs in ``BLOB_CONTAINER`` of the storage account in ``AZURE_STORAGE_CONN``.
+  Downloads ask Azure for exactly the requested byte range and pass its chunks straight through.
+
+Either way uploads are copied in fixed-size chunks, so no attachment is ever held in memory.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, BinaryIO, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from azure.storage.blob.aio import BlobServiceClient
+    HAVE_AZURE_BLOB = True
+except Exception:
+    BlobServiceClient = None
+    HAVE_AZURE_BLOB = False
+
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local")
+BLOB_ROOT = os.getenv("BLOB_ROOT", "/data/attachments")
+BLOB_CONTAINER = os.getenv("BLOB_CONTAINER", "attachments")
+BLOB_CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_SIZE", str(1024 * 1024)))
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class RangeNotSatisfiable(Exception):
+    def __init__(self, size: int):
+        self.size = size
+
+
+@dataclass
+class StoredBlob:
+    key: str
+    size: int
+    etag: str
+    url: str
+
+
+def _blob_key(filename: str) -> str:
+    name = _SAFE_NAME.sub("_", os.path.basename(filename or "")).strip("._") or "file"
+    return f"{uuid.uuid4().hex}/{name[:100]}"
+
+
+class LocalBlobStore:
+    local = True
+
+    def __init__(self, root: str = BLOB_ROOT):
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("Invalid blob key")
+        return path
+
+    async def put(self, filename: str, source: BinaryIO) -> StoredBlob:
+        key = _blob_key(filename)
+        return await run_in_threadpool(self._write, key, source)
+
+    def _write(self, key: str, source: BinaryIO) -> StoredBlob:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Write to a temp file and rename so a partial upload is never served
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while chunk := source.read(BLOB_CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return StoredBlob(key, size, f'"{digest.hexdigest()}"', f"local://{key}")
+
+    async def close(self):
+        pass
+
+
+class AzureBlobStore:
+    local = False
+
+    def __init__(self, conn_str: str, container: str = BLOB_CONTAINER):
+        if not HAVE_AZURE_BLOB:
+            raise RuntimeError("azure-storage-blob is required for BLOB_BACKEND=azure")
+        self._service = BlobServiceClient.from_connection_string(conn_str)
+        self._container = self._service.get_container_client(container)
+
+    async def put(self, filename: str, source: BinaryIO) -> StoredBlob:
+        key = _blob_key(filename)
+        blob = self._container.get_blob_client(key)
+        # The SDK uploads a file object in blocks of max_block_size
+        result = await blob.upload_blob(source, max_concurrency=2)
+        props = await blob.get_blob_properties()
+        return StoredBlob(key, props.size, result["etag"], blob.url)
+
+    async def stream(self, key: str, start: int, length: int) -> AsyncIterator[bytes]:
+        downloader = await self._container.get_blob_client(key).download_blob(
+            offset=start, length=length
+        )
+        async for chunk in downloader.chunks():
+            yield chunk
+
+    async def close(self):
+        await self._service.close()
+
+
+def create_blob_store():
+    if BLOB_BACKEND == "azure":
+        return AzureBlobStore(os.getenv("AZURE_STORAGE_CONN", ""))
+    return LocalBlobStore()
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        value = value.replace(tzinfo=timezone.utc)
+    return formatdate(value.timestamp(), usegmt=True)
+
+
+def content_disposition(filename: Optional[str]) -> str:
+    if not filename:
+        return "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into ``(start, end_exclusive)``.
+
+    Returns None when the whole body should be sent: no header, a malformed one or a
+    multi-range request (which servers may answer in full). Raises ``RangeNotSatisfiable``
+    when the range lies entirely past the end.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if not start_s:
+            # Suffix range: the last N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise RangeNotSatisfiable(size)
+            return max(size - length, 0), size
+        start = int(start_s)
+        end = min(int(end_s) + 1, size) if end_s else size
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(size)
+    if end <= start:
+        return None
+    return start, end
+
+
+def not_modified(
+    etag: str,
+    last_modified: datetime,
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since for a GET (If-None-Match wins when given)."""
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def if_range_matches(if_range: Optional[str], etag: str, last_modified: str) -> bool:
+    """A Range is honoured only while the representation still matches If-Range."""
+    if if_range is None:
+        return True
+    if if_range.startswith("W/"):
+        return False
+    return if_range in (etag, last_modified)
@@ -0,0 +1,96 @@
+"""Maintenance commands for the Requests Hub database.
+
+Usage:
+    python cli.py rebuild-stats
+    python cli.py purge-idempotency-keys
+    python cli.py archive --older-than-days 90
+"""
+import argparse
+import asyncio
+import os
+from datetime import timedelta
+
+from archive import archive_resolved
+from main import (
+    Attachment,
+    AttachmentArchive,
+    Base,
+    Request,
+    RequestArchive,
+    RequestEscalation,
+    RequestStat,
+    SessionLocal,
+    engine,
+    idempotency_store,
+)
+from stats import ensure_stats_schema, rebuild_stats
+
+
+async def cmd_rebuild_stats(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_stats_schema(conn)
+        if conn.dialect.name == "postgresql":
+            # Block concurrent writers so no trigger delta lands between the delete and insert
+            await conn.exec_driver_sql("LOCK TABLE request_stats IN EXCLUSIVE MODE")
+        await rebuild_stats(
+            conn,
+            RequestStat.__table__,
+            Request.__table__,
+            RequestEscalation.__table__,
+            RequestArchive.__table__,
+        )
+    print("Rebuilt request_stats from requests, requests_archive and request_escalations")
+
+
+async def cmd_purge_idempotency_keys(args):
+    async with SessionLocal() as db:
+        purged = await idempotency_store.purge_expired(db)
+    print(f"Purged {purged} expired idempotency keys")
+
+
+async def cmd_archive(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    result = await archive_resolved(
+        engine,
+        Request.__table__,
+        RequestArchive.__table__,
+        Attachment.__table__,
+        AttachmentArchive.__table__,
+        older_than=timedelta(days=args.older_than_days),
+        batch_size=args.batch_size,
+        pause=args.pause,
+        max_batches=args.max_batches,
+    )
+    print(f"Archived {result['moved']} requests in {result['batches']} batches")
+
+
+def create_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Requests Hub maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild-stats", help="Recompute request_stats from scratch")
+    rebuild.set_defaults(func=cmd_rebuild_stats)
+    purge = sub.add_parser("purge-idempotency-keys", help="Delete expired Idempotency-Key rows")
+    purge.set_defaults(func=cmd_purge_idempotency_keys)
+    archive = sub.add_parser("archive", help="Move old resolved requests to requests_archive")
+    archive.add_argument(
+        "--older-than-days",
+        type=int,
+        default=int(os.getenv("ARCHIVE_AFTER_DAYS", "90")),
+        help="Archive requests resolved and untouched for this many days (default: 90)",
+    )
+    archive.add_argument("--batch-size", type=int, default=500)
+    archive.add_argument("--pause", type=float, default=0.1, help="Seconds between batches")
+    archive.add_argument("--max-batches", type=int, default=0, help="Stop after N (0: no limit)")
+    archive.set_defaults(func=cmd_archive)
+    return parser
+
+
+def main():
+    args = create_argument_parser().parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Optional
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from blobs import LocalBlobStore
+from main import Base, admission, app, get_blob_store, get_db, get_db_opener
+from search import ensure_search_schema
+from stats import ensure_stats_schema
+
+
+@pytest_asyncio.fixture
+async def db_engine(tmp_path):
+    """A throwaway SQLite database with the same schema setup as API startup."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_search_schema(conn)
+        await ensure_stats_schema(conn)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def client(db_engine):
+    """An HTTP client for the app with ``get_db`` (and its lazy opener) bound to the test database."""
+    session_factory = sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def _get_test_db():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = _get_test_db
+    app.dependency_overrides[get_db_opener] = lambda: asynccontextmanager(_get_test_db)
+    app.state.temporal_client = None
+    # Every test shares one client address; admission control has its own tests
+    admission.enabled = False
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            yield ac
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(get_db_opener, None)
+        admission.enabled = True
+
+
+@pytest.fixture
+def make_request(client):
+    async def _make(**overrides):
+        body = {"title": "Test", "description": None, "type": "bug", "priority": "low"}
+        body.update(overrides)
+        resp = await client.post("/api/requests", json=body)
+        assert resp.status_code == 200, resp.text
+        return resp.json()
+
+    return _make
+
+
+@pytest.fixture
+def blob_store(tmp_path):
+    """A local blob store in a temp directory, used by the attachment endpoints."""
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    app.dependency_overrides[get_blob_store] = lambda: store
+    yield store
+    app.dependency_overrides.pop(get_blob_store, None)
+
+
+class QueryCounter:
+    """Counts the SQL statements and database round-trips an engine makes.
+
+    A round-trip is a statement sent or a COMMIT/ROLLBACK; statements run by triggers inside
+    the database are free. Used through the ``query_budget`` fixture.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.statements: List[str] = []
+        self.transaction_ends = 0
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.engine, "commit", self._on_transaction_end)
+        event.listen(self.engine, "rollback", self._on_transaction_end)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def _on_transaction_end(self, conn):
+        self.transaction_ends += 1
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.statements) + self.transaction_ends
+
+    def reset(self):
+        self.statements.clear()
+        self.transaction_ends = 0
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(self.engine, "commit", self._on_transaction_end)
+        event.remove(self.engine, "rollback", self._on_transaction_end)
+
+    @contextmanager
+    def budget(self, statements: int, round_trips: Optional[int] = None):
+        """Fail when the block exceeds ``statements`` (or ``round_trips``), listing the SQL."""
+        self.reset()
+        yield self
+        over = len(self.statements) > statements or (
+            round_trips is not None and self.round_trips > round_trips
+        )
+        if over:
+            listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(self.statements, 1))
+            pytest.fail(
+                f"Query budget exceeded: {len(self.statements)} statements "
+                f"(budget {statements}), {self.round_trips} round-trips "
+                f"(budget {round_trips if round_trips is not None else 'unchecked'}):\n{listing}",
+                pytrace=False,
+            )
+
+
+@pytest.fixture
+def query_budget(db_engine):
+    """``with query_budget.budget(statements=1): ...`` fails if the block runs more SQL."""
+    counter = QueryCounter(db_engine)
+    yield counter
+    counter.close()
@@ -0,0 +1,223 @@
+"""Idempotency-Key handling for retried POSTs.
+
+Responses are remembered per key in two tiers:
+
+- an in-process LRU with a TTL, so a replay on the same replica touches neither the database
+  nor Temporal, plus a table of in-flight futures so concurrent duplicates wait for the first;
+- the ``idempotency_keys`` table for cross-replica replays. The key row is claimed with
+  ``INSERT .. ON CONFLICT`` in the same transaction as the work it guards and committed together
+  with the stored response, so a duplicate on another replica blocks on the uncommitted key
+  until the first request finishes, then reads its response. A failed request rolls back its
+  claim and leaves the key free for the retry.
+
+A stored response can be flagged ``pending`` when work after the commit (starting the
+request's workflow) failed; replays see the flag and retry that work. Expired rows are deleted
+by ``start_purging`` every ``IDEMPOTENCY_PURGE_SECONDS`` on each replica.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "3600"))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body."""
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    body: Any
+    pending: bool = False
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-serializable request body."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        table,
+        ttl: int = IDEMPOTENCY_TTL_SECONDS,
+        max_entries: int = IDEMPOTENCY_CACHE_SIZE,
+    ):
+        self._table = table
+        self._ttl = ttl
+        self._max_entries = max_entries
+        # key -> (monotonic expiry, response), least recently used first
+        self._local: "OrderedDict[str, Tuple[float, StoredResponse]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._purger: Optional[asyncio.Task] = None
+
+    async def execute(
+        self,
+        key: str,
+        request_fingerprint: str,
+        db,
+        handler: Callable[[], Awaitable[Tuple[int, Any]]],
+    ) -> Tuple[StoredResponse, bool]:
+        """Run ``handler`` at most once per key and return ``(response, replayed)``.
+
+        ``handler`` performs its writes on ``db`` without committing and returns
+        ``(status_code, json_body)``; the commit happens here together with the stored response.
+        """
+        stored = await self.replay_local(key, request_fingerprint)
+        if stored is not None:
+            return stored, True
+
+        future = asyncio.get_running_loop().create_future()
+        # Waiters re-raise a failure themselves; don't warn when nobody was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            stored, replayed = await self._execute_db(key, request_fingerprint, db, handler)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._put_local(key, stored)
+        future.set_result(stored)
+        return self._check(stored, request_fingerprint), replayed
+
+    async def replay_local(self, key: str, request_fingerprint: str) -> Optional[StoredResponse]:
+        """The response this replica has (or is computing) for ``key``; None when it has none.
+
+        Never touches the database, so callers can try it before checking out a connection.
+        """
+        cached = self._get_local(key)
+        if cached is not None:
+            return self._check(cached, request_fingerprint)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return self._check(await asyncio.shield(inflight), request_fingerprint)
+        return None
+
+    async def set_pending(self, key: str, pending: bool, db):
+        """Flag (or clear) work the stored response still owes, so replays know to retry it."""
+        t = self._table
+        await db.execute(t.update().where(t.c.key == key).values(pending=pending))
+        await db.commit()
+        entry = self._local.get(key)
+        if entry is not None:
+            self._local[key] = (entry[0], replace(entry[1], pending=pending))
+
+    async def purge_expired(self, db) -> int:
+        result = await db.execute(
+            delete(self._table).where(self._table.c.expires_at < datetime.now(timezone.utc))
+        )
+        await db.commit()
+        return result.rowcount
+
+    def start_purging(self, session_factory, interval: float = IDEMPOTENCY_PURGE_SECONDS):
+        """Delete expired rows every ``interval`` seconds in the background (0 disables)."""
+        if interval > 0 and self._purger is None:
+            self._purger = asyncio.get_running_loop().create_task(
+                self._purge_forever(session_factory, interval)
+            )
+
+    async def stop_purging(self):
+        if self._purger is not None:
+            self._purger.cancel()
+            try:
+                await self._purger
+            except asyncio.CancelledError:
+                pass
+            self._purger = None
+
+    async def _purge_forever(self, session_factory, interval: float):
+        while True:
+            try:
+                async with session_factory() as db:
+                    purged = await self.purge_expired(db)
+                if purged:
+                    print(f"Purged {purged} expired idempotency keys")
+            except Exception as e:
+                print("Idempotency key purge failed:", e)
+            await asyncio.sleep(interval)
+
+    async def _execute_db(self, key, request_fingerprint, db, handler):
+        t = self._table
+        now = datetime.now(timezone.utc)
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        claim = insert(t).values(
+            key=key,
+            fingerprint=request_fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(seconds=self._ttl),
+        )
+        # Reclaim keys whose TTL has passed; a live key conflicts and is read back below
+        claim = claim.on_conflict_do_update(
+            index_elements=[t.c.key],
+            set_={
+                "fingerprint": claim.excluded.fingerprint,
+                "status_code": None,
+                "response": None,
+                "pending": None,
+                "created_at": claim.excluded.created_at,
+                "expires_at": claim.excluded.expires_at,
+            },
+            where=t.c.expires_at < now,
+        ).returning(t.c.key)
+        claimed = (await db.execute(claim)).first()
+        if claimed is None:
+            row = (
+                await db.execute(
+                    select(t.c.fingerprint, t.c.status_code, t.c.response, t.c.pending).where(
+                        t.c.key == key
+                    )
+                )
+            ).one()
+            await db.rollback()
+            stored = StoredResponse(
+                row.fingerprint, row.status_code, json.loads(row.response), bool(row.pending)
+            )
+            return stored, True
+
+        status_code, body = await handler()
+        await db.execute(
+            t.update()
+            .where(t.c.key == key)
+            .values(status_code=status_code, response=json.dumps(body))
+        )
+        await db.commit()
+        return StoredResponse(request_fingerprint, status_code, body), False
+
+    def _check(self, stored: StoredResponse, request_fingerprint: str) -> StoredResponse:
+        if stored.fingerprint != request_fingerprint:
+            raise IdempotencyConflict()
+        return stored
+
+    def _get_local(self, key: str) -> Optional[StoredResponse]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires, stored = entry
+        if expires <= time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return stored
+
+    def _put_local(self, key: str, stored: StoredResponse):
+        self._local[key] = (time.monotonic() + self._ttl, stored)
+        self._local.move_to_end(key)
+        while len(self._local) > self._max_entries:
+            self._local.popitem(last=False)
@@ -0,0 +1,79 @@
+"""Priority lanes: which Temporal task queue a request's workflow runs on.
+
+Lanes are configured in one place, ``REQUEST_LANES``, read by both the API (to route new
+workflows) and the worker (to poll each lane with its own slot budget). Format::
+
+    lane=priority|priority:slots,...
+
+``*`` marks the catch-all lane for priorities no other lane lists; it runs on the base
+``TASK_QUEUE`` so workflows started before lanes existed keep being served. Other lanes run on
+``<TASK_QUEUE>-<lane>``. Activities inherit their workflow's task queue, so a flood of
+low-priority work can only ever occupy the low lane's slots.
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TASK_QUEUE = os.getenv("TASK_QUEUE") or "requests-hub"
+REQUEST_LANES = os.getenv("REQUEST_LANES") or "critical=high:16,default=*:32,low=low:8"
+CATCH_ALL = "*"
+# Temporal rejects a workflow cache with fewer than two workflow task slots (sticky and normal polls)
+MIN_WORKFLOW_TASK_SLOTS = 2
+
+
+def workflow_task_slots(slots: int) -> int:
+    """The ``max_concurrent_workflow_tasks`` for a lane with ``slots`` slots."""
+    return max(slots, MIN_WORKFLOW_TASK_SLOTS)
+
+
+@dataclass(frozen=True)
+class Lane:
+    name: str
+    task_queue: str
+    priorities: Tuple[str, ...]
+    slots: int
+
+
+def parse_lanes(spec: str = REQUEST_LANES, base_queue: str = TASK_QUEUE) -> List[Lane]:
+    lanes: List[Lane] = []
+    seen: Dict[str, str] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, rest = item.split("=", 1)
+        priorities, slots = rest.rsplit(":", 1)
+        name = name.strip()
+        keys = tuple(p.strip().lower() for p in priorities.split("|") if p.strip())
+        for key in keys:
+            if key in seen:
+                raise ValueError(f"Priority {key!r} is in lanes {seen[key]!r} and {name!r}")
+            seen[key] = name
+        queue = base_queue if CATCH_ALL in keys else f"{base_queue}-{name}"
+        lanes.append(Lane(name, queue, keys, int(slots)))
+    if CATCH_ALL not in seen:
+        raise ValueError("REQUEST_LANES needs a catch-all lane ('*')")
+    return lanes
+
+
+class LaneRouter:
+    def __init__(self, lanes: Optional[List[Lane]] = None):
+        self.lanes = parse_lanes() if lanes is None else lanes
+        self._by_priority = {p: lane for lane in self.lanes for p in lane.priorities}
+        self.default = self._by_priority[CATCH_ALL]
+
+    def lane_for(self, priority: Optional[str]) -> Lane:
+        return self._by_priority.get((priority or "").lower(), self.default)
+
+    def task_queue_for(self, priority: Optional[str]) -> str:
+        return self.lane_for(priority).task_queue
+
+    def select(self, names: Optional[Iterable[str]] = None) -> List[Lane]:
+        """Lanes with the given names (all lanes when ``names`` is empty or None)."""
+        wanted = {n.strip() for n in names or () if n.strip()}
+        if not wanted or CATCH_ALL in wanted:
+            return list(self.lanes)
+        unknown = wanted - {lane.name for lane in self.lanes}
+        if unknown:
+            raise ValueError(f"Unknown lanes: {', '.join(sorted(unknown))}")
+        return [lane for lane in self.lanes if lane.name in wanted]
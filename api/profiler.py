@@ -0,0 +1,215 @@
+"""On-demand sampling profiler and event-loop stall detection for the API and the worker.
+
+``SamplingProfiler`` samples every thread's stack with ``sys._current_frames()`` from a
+background thread for a fixed number of seconds and returns collapsed stacks, one
+``thread;outer;...;inner count`` line per distinct stack. Feed that to ``flamegraph.pl`` or
+load it in https://www.speedscope.app. Nothing runs between profiles.
+
+``LoopLagMonitor`` measures how late the event loop wakes a periodic sleeper, which is the
+signal admission control sheds on. With ``stall_threshold`` set, a watchdog thread also
+checks the sleeper's heartbeat. When the loop has not come round for longer than the
+threshold, the watchdog logs the loop thread's stack at that moment, which names the
+callback or blocking call that is holding the loop. Both sides wake once per ``interval``,
+so an idle process pays next to nothing.
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp")
+# Log the loop thread's stack when the event loop is blocked this long (0 disables)
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "200"))
+# Innermost frames kept in a stall log entry
+LOOP_STALL_STACK_DEPTH = 20
+
+
+def _log_structured(level: str, action: str, payload: dict):
+    entry = {
+        "ts": datetime.utcnow().isoformat() + "Z",
+        "level": level,
+        "action": action,
+        **payload,
+    }
+    print(json.dumps(entry))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _stack(frame, limit: Optional[int] = None) -> List[str]:
+    """Frame labels from outermost to innermost (only the innermost ``limit`` if given)."""
+    labels = []
+    while frame is not None and (limit is None or len(labels) < limit):
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Collects collapsed stacks of every thread; one profile runs at a time per process."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval_ms / 1000.0
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval: Optional[float] = None) -> Counter:
+        """Sample stacks for ``seconds``; blocking, so run it off the event loop."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            interval = self.interval if interval is None else interval
+            seconds = min(seconds, self.max_seconds)
+            me = threading.get_ident()
+            names: Dict[int, str] = {}
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if ident not in names:
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                    thread = names.get(ident, str(ident)).replace(";", ":").replace(" ", "_")
+                    stacks[";".join([thread, *_stack(frame)])] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+    async def profile(self, seconds: float, interval: Optional[float] = None) -> str:
+        """Profile for ``seconds`` without blocking the loop; returns collapsed stacks."""
+        stacks = await asyncio.to_thread(self.sample, seconds, interval)
+        return format_collapsed(stacks)
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def install_profile_signal(
+    profiler: SamplingProfiler,
+    seconds: float,
+    prefix: str,
+    directory: str = PROFILE_DIR,
+    signum: int = signal.SIGUSR1,
+):
+    """Write a profile to ``<directory>/<prefix>-<pid>-<time>.collapsed`` on ``signum``.
+
+    Call from the running loop, e.g. ``kill -USR1 <pid>`` to profile a worker for ``seconds``.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def _dump():
+        path = os.path.join(directory, f"{prefix}-{os.getpid()}-{int(time.time())}.collapsed")
+        _log_structured("info", "profile_started", {"seconds": seconds, "path": path})
+        try:
+            collapsed = await profiler.profile(seconds)
+            with open(path, "w") as out:
+                out.write(collapsed)
+        except ProfilerBusy:
+            _log_structured("warn", "profile_busy", {"path": path})
+            return
+        except OSError as e:
+            _log_structured("error", "profile_write_failed", {"path": path, "error": str(e)})
+            return
+        _log_structured("info", "profile_written", {"path": path})
+
+    loop.add_signal_handler(signum, lambda: loop.create_task(_dump()))
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a periodic sleeper and reports stalls.
+
+    ``lag`` decays towards the latest sample so one slow tick doesn't shed for long, and a
+    single wakeup per ``interval`` keeps the cost negligible when the loop is idle. With a
+    ``stall_threshold`` (seconds), a watchdog thread logs the loop thread's stack once per
+    stall longer than the threshold.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        decay: float = 0.5,
+        stall_threshold: float = LOOP_STALL_THRESHOLD_MS / 1000.0,
+        on_stall: Optional[Callable[[float, List[str]], None]] = None,
+    ):
+        self.interval = interval
+        self.decay = decay
+        self.lag = 0.0
+        self.stall_threshold = stall_threshold
+        self.on_stall = on_stall or self._log_stall
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._heartbeat = time.monotonic()
+            self._loop_thread = threading.get_ident()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.stall_threshold > 0 and (self._watchdog is None or not self._watchdog.is_alive()):
+            self._stopped.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-stall-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            sample = max(loop.time() - started - self.interval, 0.0)
+            self.lag = max(sample, self.lag * self.decay)
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        reported = None
+        check_every = min(self.interval, self.stall_threshold / 2)
+        while not self._stopped.wait(check_every):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked <= self.stall_threshold or heartbeat == reported:
+                continue
+            # Report each stall once, with the stack that is holding the loop right now
+            reported = heartbeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            self.on_stall(blocked, _stack(frame, LOOP_STALL_STACK_DEPTH) if frame else [])
+
+    @staticmethod
+    def _log_stall(blocked: float, stack: List[str]):
+        _log_structured("warn", "event_loop_stall", {"blocked_ms": round(blocked * 1000), "stack": stack})
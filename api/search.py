@@ -0,0 +1,200 @@
+"""Ranked full-text search with facet counts over the ``requests`` table.
+
+Postgres keeps a generated ``search_vector`` tsvector column with a GIN index; SQLite (local
+runs and tests) falls back to an external-content FTS5 table kept in sync by triggers. Hits,
+facet counts and the total are returned by a single UNION ALL statement over one CTE, so a
+search costs one round trip however many facets are requested.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import (
+    Float,
+    Integer,
+    String,
+    cast,
+    column,
+    func,
+    literal,
+    literal_column,
+    null,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.sql.expression import ColumnElement
+
+FACET_COLUMNS = ("status", "type", "priority", "assignee_id")
+
+_PG_SEARCH_DDL = [
+    """
+    ALTER TABLE requests ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_requests_search_vector ON requests USING GIN (search_vector)",
+]
+
+_SQLITE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts
+    USING fts5(title, description, content='requests', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS requests_fts_ai AFTER INSERT ON requests BEGIN
+        INSERT INTO requests_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS requests_fts_ad AFTER DELETE ON requests BEGIN
+        INSERT INTO requests_fts(requests_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS requests_fts_au AFTER UPDATE OF title, description ON requests
+    BEGIN
+        INSERT INTO requests_fts(requests_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO requests_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+
+async def ensure_search_schema(conn):
+    """Create the dialect-specific full-text index; safe to run on every startup."""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        for ddl in _PG_SEARCH_DDL:
+            await conn.execute(text(ddl))
+    elif dialect == "sqlite":
+        existed = (
+            await conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'requests_fts'")
+            )
+        ).first()
+        for ddl in _SQLITE_SEARCH_DDL:
+            await conn.execute(text(ddl))
+        if not existed:
+            # Index rows that were inserted before the FTS table existed
+            await conn.execute(text("INSERT INTO requests_fts(requests_fts) VALUES ('rebuild')"))
+
+
+def _fts5_query(q: str) -> str:
+    # Quote every term so user input cannot trip FTS5 query syntax; terms are ANDed
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def build_search_query(
+    requests,
+    dialect: str,
+    q: Optional[str],
+    filters: Sequence[ColumnElement],
+    limit: int,
+    offset: int,
+):
+    """Build one statement returning ranked hits, per-facet counts and the total match count.
+
+    Rows are tagged by ``kind``: ``hit`` rows carry the request columns and ``rank``,
+    ``facet`` rows carry ``facet``/``value``/``count`` and the ``total`` row carries ``count``.
+    """
+    source = requests
+    conditions: List[ColumnElement] = list(filters)
+    rank: ColumnElement = literal(0.0, Float)
+    if q and q.strip():
+        if dialect == "postgresql":
+            tsquery = func.websearch_to_tsquery("english", q)
+            # Generated column added by ensure_search_schema; not mapped on the model
+            vector = literal_column(f"{requests.name}.search_vector")
+            conditions.append(vector.op("@@")(tsquery))
+            rank = func.ts_rank_cd(vector, tsquery)
+        else:
+            fts = table("requests_fts", column("rowid", Integer), column("rank", Float))
+            fts_hits = (
+                select(fts.c.rowid.label("id"), (-fts.c.rank).label("rank"))
+                .where(text("requests_fts MATCH :fts_query").bindparams(fts_query=_fts5_query(q)))
+                .subquery("fts_hits")
+            )
+            source = requests.join(fts_hits, fts_hits.c.id == requests.c.id)
+            rank = fts_hits.c.rank
+
+    matched = (
+        select(*requests.c, cast(rank, Float).label("rank"))
+        .select_from(source)
+        .where(*conditions)
+        .cte("matched")
+    )
+
+    request_columns = [c for c in matched.c if c.key != "rank"]
+    page = (
+        select(matched)
+        .order_by(matched.c.rank.desc(), matched.c.id.desc())
+        .limit(limit)
+        .offset(offset)
+        .subquery("page")
+    )
+    hits = select(
+        literal("hit").label("kind"),
+        *[page.c[c.key] for c in request_columns],
+        page.c.rank,
+        cast(null(), String).label("facet"),
+        cast(null(), String).label("value"),
+        cast(null(), Integer).label("count"),
+    )
+
+    def _blank(kind, facet, value, count):
+        return select(
+            literal(kind).label("kind"),
+            *[cast(null(), c.type).label(c.key) for c in request_columns],
+            cast(null(), Float).label("rank"),
+            facet,
+            value,
+            count,
+        )
+
+    parts = [hits]
+    for name in FACET_COLUMNS:
+        col = matched.c[name]
+        parts.append(
+            _blank(
+                "facet",
+                literal(name).label("facet"),
+                cast(col, String).label("value"),
+                func.count().label("count"),
+            )
+            .select_from(matched)
+            .group_by(col)
+        )
+    parts.append(
+        _blank(
+            "total",
+            cast(null(), String).label("facet"),
+            cast(null(), String).label("value"),
+            func.count().label("count"),
+        ).select_from(matched)
+    )
+    return parts[0].union_all(*parts[1:])
+
+
+def collect_search_rows(rows) -> Dict[str, Any]:
+    """Split the tagged rows of ``build_search_query`` into hits, facets and total."""
+    hits: List[Dict[str, Any]] = []
+    facets: Dict[str, Dict[str, int]] = {name: {} for name in FACET_COLUMNS}
+    total = 0
+    for row in rows:
+        kind = row["kind"]
+        if kind == "hit":
+            hit = {k: v for k, v in row.items() if k not in ("kind", "facet", "value", "count")}
+            hits.append(hit)
+        elif kind == "facet":
+            if row["value"] is not None:
+                facets[row["facet"]][row["value"]] = row["count"]
+        else:
+            total = row["count"]
+    # UNION ALL gives no ordering guarantee across branches; restore rank order for hits
+    hits.sort(key=lambda h: (h["rank"] or 0.0, h["id"]), reverse=True)
+    return {"total": total, "results": hits, "facets": facets}
@@ -0,0 +1,214 @@
+"""Async secret lookups with an in-memory TTL cache.
+
+Secrets are resolved through a single backend chosen from the environment:
+
+- Key Vault (``KEYVAULT_URL`` set): one async ``DefaultAzureCredential`` shared by every lookup.
+- Local: environment variables first, then ``SECRETS_FILE`` (a JSON object or a directory with
+  one file per secret, e.g. ``/run/secrets``) for offline runs.
+
+Cached values are refreshed in the background shortly before they expire, and listeners
+registered with ``on_change`` are called when a refreshed value differs, so a rotated secret is
+picked up without a restart.
+"""
+import asyncio
+import inspect
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.identity.aio import DefaultAzureCredential
+    from azure.keyvault.secrets.aio import SecretClient as KVSecretClient
+    HAVE_KEYVAULT = True
+except Exception:
+    ResourceNotFoundError = None
+    DefaultAzureCredential = None
+    KVSecretClient = None
+    HAVE_KEYVAULT = False
+
+KEYVAULT_URL = os.getenv("KEYVAULT_URL", "")
+SECRETS_FILE = os.getenv("SECRETS_FILE", "")
+SECRET_TTL_SECONDS = float(os.getenv("SECRET_TTL_SECONDS", "300"))
+SECRET_REFRESH_MARGIN = float(os.getenv("SECRET_REFRESH_MARGIN", "60"))
+# Back-off used when a refresh fails and the previous value keeps being served
+SECRET_RETRY_SECONDS = float(os.getenv("SECRET_RETRY_SECONDS", "15"))
+
+
+class KeyVaultBackend:
+    """Reads secrets from Azure Key Vault using a single async credential."""
+
+    def __init__(self, vault_url: str):
+        self._credential = DefaultAzureCredential()
+        self._client = KVSecretClient(vault_url=vault_url, credential=self._credential)
+
+    async def fetch(self, name: str) -> Optional[str]:
+        try:
+            secret = await self._client.get_secret(name)
+        except ResourceNotFoundError:
+            return None
+        return secret.value
+
+    async def close(self):
+        await self._client.close()
+        await self._credential.close()
+
+
+class LocalBackend:
+    """Reads secrets from the environment, then from an optional JSON file or directory."""
+
+    def __init__(self, path: str = ""):
+        self._path = path
+
+    def _read_file(self, name: str) -> Optional[str]:
+        if os.path.isdir(self._path):
+            candidate = os.path.join(self._path, name)
+            if not os.path.isfile(candidate):
+                return None
+            with open(candidate, "r") as f:
+                return f.read().strip()
+        with open(self._path, "r") as f:
+            value = json.load(f).get(name)
+        return None if value is None else str(value)
+
+    async def fetch(self, name: str) -> Optional[str]:
+        value = os.getenv(name)
+        if value:
+            return value
+        if not self._path or not os.path.exists(self._path):
+            return None
+        # Re-read on every fetch so edits to the file behave like a rotation
+        return await asyncio.to_thread(self._read_file, name)
+
+    async def close(self):
+        return None
+
+
+class SecretProvider:
+    """TTL cache in front of a secret backend with single-flight loads and background refresh."""
+
+    def __init__(
+        self,
+        backend: Any,
+        ttl: float = SECRET_TTL_SECONDS,
+        refresh_margin: float = SECRET_REFRESH_MARGIN,
+        retry_after: float = SECRET_RETRY_SECONDS,
+    ):
+        self._backend = backend
+        self._ttl = ttl
+        self._refresh_margin = min(refresh_margin, ttl / 2)
+        self._retry_after = retry_after
+        # name -> (value, monotonic expiry)
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+        # name -> monotonic time of the next attempt after a failed refresh
+        self._retry_at: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._listeners: Dict[str, List[Callable[[Optional[str]], Any]]] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def get(self, name: str) -> Optional[str]:
+        """Return the cached value for ``name``, loading it from the backend when expired."""
+        entry = self._cache.get(name)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        return await self._load(name)
+
+    def on_change(self, name: str, callback: Callable[[Optional[str]], Any]):
+        """Register ``callback(value)`` (sync or async) to run when ``name`` is rotated."""
+        self._listeners.setdefault(name, []).append(callback)
+
+    def invalidate(self, name: Optional[str] = None):
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+    def start(self):
+        """Start the background refresh loop on the running event loop."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+        await self._backend.close()
+
+    async def _load(self, name: str) -> Optional[str]:
+        # Concurrent callers for the same secret share one backend round-trip
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(name))
+            self._inflight[name] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(name, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, name: str) -> Optional[str]:
+        previous = self._cache.get(name)
+        try:
+            value = await self._backend.fetch(name)
+        except Exception as e:
+            if previous is None:
+                raise
+            # Keep serving the last known value and retry soon rather than failing callers
+            print(f"Secret refresh failed for {name}, serving cached value:", e)
+            retry_at = time.monotonic() + self._retry_after
+            self._cache[name] = (previous[0], retry_at)
+            self._retry_at[name] = retry_at
+            return previous[0]
+        self._cache[name] = (value, time.monotonic() + self._ttl)
+        self._retry_at.pop(name, None)
+        if previous is not None and previous[0] != value:
+            await self._notify(name, value)
+        return value
+
+    async def _notify(self, name: str, value: Optional[str]):
+        for callback in self._listeners.get(name, []):
+            try:
+                result = callback(value)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Secret change listener for {name} failed:", e)
+
+    def _refresh_due(self, name: str, expires: float) -> float:
+        # A failed entry waits out its retry delay; the refresh margin would put it due at once
+        retry_at = self._retry_at.get(name)
+        return retry_at if retry_at is not None else expires - self._refresh_margin
+
+    def _next_refresh_delay(self, now: float) -> float:
+        if not self._cache:
+            return self._ttl
+        next_due = min(self._refresh_due(name, expires) for name, (_, expires) in self._cache.items())
+        return max(next_due - now, 1.0)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self._next_refresh_delay(time.monotonic()))
+            now = time.monotonic()
+            for name, (_, expires) in list(self._cache.items()):
+                if self._refresh_due(name, expires) <= now:
+                    try:
+                        await self._load(name)
+                    except Exception as e:
+                        print(f"Background refresh failed for {name}:", e)
+
+
+_provider: Optional[SecretProvider] = None
+
+
+def get_secret_provider() -> SecretProvider:
+    """Return the process-wide provider, built from the environment on first use."""
+    global _provider
+    if _provider is None:
+        if KEYVAULT_URL and HAVE_KEYVAULT:
+            backend = KeyVaultBackend(KEYVAULT_URL)
+        else:
+            backend = LocalBackend(SECRETS_FILE)
+        _provider = SecretProvider(backend)
+    return _provider
@@ -0,0 +1,232 @@
+"""Incrementally maintained request counters backing ``GET /api/stats``.
+
+``request_stats`` holds one ``(dimension, value) -> count`` row per status, priority and type
+plus the ``escalated`` counter. Row-level triggers on ``requests`` and ``request_escalations``
+apply the deltas inside the writing transaction, so every writer (API, bulk updates, the
+worker's escalation insert) keeps the counters current and reading them never scans
+``requests``. The total is the sum of the status rows. Each create still bumps its status,
+priority and type rows, so concurrent creates with the same values take turns on those row
+locks until their transactions commit. ``ensure_stats_schema`` installs the triggers and fills the
+counters once per ``STATS_SCHEMA_VERSION``, and ``rebuild_stats`` recomputes everything from
+scratch if they ever drift.
+
+``requests_archive`` carries the same insert/delete triggers, so moving a request into the
+archive (see archive.py) cancels out and the counters keep covering archived requests.
+"""
+from typing import Any, Dict, Iterable, Tuple
+
+from sqlalchemy import String, cast, column, delete, func, literal, select, table, text
+
+TRACKED_DIMENSIONS = ("status", "priority", "type")
+# Bump whenever the trigger definitions change; stored as the ('schema', 'version') row
+STATS_SCHEMA_VERSION = 2
+SCHEMA_DIMENSION = "schema"
+
+_PG_STATS_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION request_stats_bump(dim text, val text, delta integer)
+    RETURNS void AS $$
+    BEGIN
+        INSERT INTO request_stats (dimension, value, count) VALUES (dim, val, delta)
+        ON CONFLICT (dimension, value) DO UPDATE SET count = request_stats.count + EXCLUDED.count;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION request_stats_track() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM request_stats_bump('status', NEW.status::text, 1);
+            PERFORM request_stats_bump('priority', NEW.priority, 1);
+            PERFORM request_stats_bump('type', NEW.type, 1);
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM request_stats_bump('status', OLD.status::text, -1);
+            PERFORM request_stats_bump('priority', OLD.priority, -1);
+            PERFORM request_stats_bump('type', OLD.type, -1);
+        ELSE
+            IF NEW.status IS DISTINCT FROM OLD.status THEN
+                PERFORM request_stats_bump('status', OLD.status::text, -1);
+                PERFORM request_stats_bump('status', NEW.status::text, 1);
+            END IF;
+            IF NEW.priority IS DISTINCT FROM OLD.priority THEN
+                PERFORM request_stats_bump('priority', OLD.priority, -1);
+                PERFORM request_stats_bump('priority', NEW.priority, 1);
+            END IF;
+            IF NEW.type IS DISTINCT FROM OLD.type THEN
+                PERFORM request_stats_bump('type', OLD.type, -1);
+                PERFORM request_stats_bump('type', NEW.type, 1);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION request_escalations_track() RETURNS trigger AS $$
+    BEGIN
+        PERFORM request_stats_bump('escalated', 'all', 1);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS request_stats_track ON requests",
+    """
+    CREATE TRIGGER request_stats_track
+    AFTER INSERT OR DELETE OR UPDATE OF status, priority, type ON requests
+    FOR EACH ROW EXECUTE FUNCTION request_stats_track()
+    """,
+    "DROP TRIGGER IF EXISTS request_stats_track ON requests_archive",
+    """
+    CREATE TRIGGER request_stats_track AFTER INSERT OR DELETE ON requests_archive
+    FOR EACH ROW EXECUTE FUNCTION request_stats_track()
+    """,
+    "DROP TRIGGER IF EXISTS request_escalations_track ON request_escalations",
+    """
+    CREATE TRIGGER request_escalations_track AFTER INSERT ON request_escalations
+    FOR EACH ROW EXECUTE FUNCTION request_escalations_track()
+    """,
+]
+
+
+def _sqlite_bump(dim: str, value: str, delta: int) -> str:
+    return (
+        "INSERT INTO request_stats (dimension, value, count) "
+        f"VALUES ('{dim}', {value}, {delta}) "
+        "ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count;"
+    )
+
+
+def _sqlite_stats_ddl():
+    bumps_in = []
+    bumps_out = []
+    for dim in TRACKED_DIMENSIONS:
+        bumps_in.append(_sqlite_bump(dim, f"new.{dim}", 1))
+        bumps_out.append(_sqlite_bump(dim, f"old.{dim}", -1))
+    ddl = []
+    tables = (("requests", "request_stats"), ("requests_archive", "request_archive_stats"))
+    for source, prefix in tables:
+        ddl.append(f"DROP TRIGGER IF EXISTS {prefix}_ai")
+        ddl.append(
+            f"CREATE TRIGGER {prefix}_ai AFTER INSERT ON {source} BEGIN "
+            + " ".join(bumps_in)
+            + " END"
+        )
+        ddl.append(f"DROP TRIGGER IF EXISTS {prefix}_ad")
+        ddl.append(
+            f"CREATE TRIGGER {prefix}_ad AFTER DELETE ON {source} BEGIN "
+            + " ".join(bumps_out)
+            + " END"
+        )
+    ddl += [
+        "DROP TRIGGER IF EXISTS request_escalations_ai",
+        "CREATE TRIGGER request_escalations_ai AFTER INSERT ON request_escalations "
+        "BEGIN " + _sqlite_bump("escalated", "'all'", 1) + " END",
+    ]
+    for dim in TRACKED_DIMENSIONS:
+        ddl.append(f"DROP TRIGGER IF EXISTS request_stats_au_{dim}")
+        ddl.append(
+            f"CREATE TRIGGER request_stats_au_{dim} AFTER UPDATE OF {dim} ON requests "
+            f"WHEN old.{dim} IS NOT new.{dim} BEGIN "
+            + _sqlite_bump(dim, f"old.{dim}", -1)
+            + " "
+            + _sqlite_bump(dim, f"new.{dim}", 1)
+            + " END"
+        )
+    return ddl
+
+
+def _source_table(name: str):
+    return table(name, *(column(dim) for dim in TRACKED_DIMENSIONS))
+
+
+async def ensure_stats_schema(conn):
+    """Install the counter-maintaining triggers and fill the counters; cheap on every startup.
+
+    Nothing happens while the stored schema version is current, so a normal boot takes no
+    locks. A first install or a trigger change recreates the triggers and rebuilds the counters
+    from the existing rows in the same transaction, so a deployment that predates them does not
+    report zeros until someone runs ``rebuild-stats``.
+    """
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        statements = _PG_STATS_DDL
+    elif dialect == "sqlite":
+        statements = _sqlite_stats_ddl()
+    else:
+        return
+    version = (
+        await conn.execute(
+            text("SELECT count FROM request_stats WHERE dimension = :dim AND value = 'version'"),
+            {"dim": SCHEMA_DIMENSION},
+        )
+    ).scalar()
+    if version == STATS_SCHEMA_VERSION:
+        return
+    for ddl in statements:
+        await conn.execute(text(ddl))
+    if dialect == "postgresql":
+        # Block concurrent writers so no trigger delta lands between the delete and insert
+        await conn.execute(text("LOCK TABLE request_stats IN EXCLUSIVE MODE"))
+    stats_table = table("request_stats", column("dimension"), column("value"), column("count"))
+    # Also drops rows earlier versions kept, such as the old ('total', 'all') counter
+    await rebuild_stats(
+        conn,
+        stats_table,
+        _source_table("requests"),
+        table("request_escalations", column("request_id")),
+        _source_table("requests_archive"),
+    )
+    await conn.execute(delete(stats_table).where(stats_table.c.dimension == SCHEMA_DIMENSION))
+    await conn.execute(
+        stats_table.insert().values(
+            dimension=SCHEMA_DIMENSION, value="version", count=STATS_SCHEMA_VERSION
+        )
+    )
+
+
+def summarize(rows: Iterable[Tuple[str, str, int]]) -> Dict[str, Any]:
+    """Shape the counter rows into the ``/api/stats`` response."""
+    summary: Dict[str, Any] = {f"by_{dim}": {} for dim in TRACKED_DIMENSIONS}
+    counters: Dict[str, int] = {}
+    for dim, value, count in rows:
+        if dim in TRACKED_DIMENSIONS:
+            if count:
+                summary[f"by_{dim}"][value] = count
+        else:
+            counters[dim] = count
+    total = sum(summary["by_status"].values())
+    escalated = counters.get("escalated", 0)
+    rate = escalated / total if total else 0.0
+    summary.update(
+        total=total,
+        escalated=escalated,
+        # Escalation is only triggered by an SLA timer expiring with the request still open,
+        # so breaches and escalations are the same population today.
+        sla_breach_rate=rate,
+        escalation_rate=rate,
+    )
+    return summary
+
+
+async def rebuild_stats(conn, stats_table, requests, escalations, archive=None):
+    """Recompute every counter from the source tables inside the caller's transaction."""
+    if archive is not None:
+        columns = [cast(requests.c[dim], String).label(dim) for dim in TRACKED_DIMENSIONS]
+        archived = [cast(archive.c[dim], String).label(dim) for dim in TRACKED_DIMENSIONS]
+        requests = select(*columns).union_all(select(*archived)).subquery("all_requests")
+    selects = [
+        select(
+            literal("escalated").label("dimension"),
+            literal("all").label("value"),
+            func.count().label("count"),
+        ).select_from(escalations)
+    ]
+    for dim in TRACKED_DIMENSIONS:
+        col = requests.c[dim]
+        selects.append(select(literal(dim), cast(col, String), func.count()).group_by(col))
+    await conn.execute(delete(stats_table).where(stats_table.c.dimension != SCHEMA_DIMENSION))
+    await conn.execute(
+        stats_table.insert().from_select(
+            ["dimension", "value", "count"], selects[0].union_all(*selects[1:])
+        )
+    )
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import AsyncClient
+
+from admission import AdmissionController, AdmissionControlMiddleware, ClientRateLimiter, _client_key
+
+
+def _app(controller):
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+
+    @app.get("/slow/{id}")
+    async def slow(id: int):
+        await release.wait()
+        return {"id": id}
+
+    @app.get("/fast")
+    async def fast():
+        return {"ok": True}
+
+    @app.get("/download")
+    async def download():
+        async def body():
+            yield b"first"
+            await release.wait()
+            yield b"rest"
+
+        return StreamingResponse(body())
+
+    app.add_middleware(AdmissionControlMiddleware, controller=controller)
+    return app, release
+
+
+def test_token_bucket_refills():
+    limiter = ClientRateLimiter(rate=1, burst=2)
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == pytest.approx(1.0)
+    assert limiter.acquire("b", now=0) == 0
+    assert limiter.acquire("a", now=1.0) == 0
+
+
+@pytest.mark.asyncio
+async def test_client_over_rate_gets_429_with_retry_after():
+    app, _ = _app(AdmissionController(client_rate=1, client_burst=2))
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        codes = [(await ac.get("/fast")).status_code for _ in range(3)]
+        assert codes == [200, 200, 429]
+        resp = await ac.get("/fast")
+        assert resp.headers["retry-after"] == "1"
+        # Exempt paths are never shed
+        assert (await ac.get("/healthz")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_route_concurrency_limit_sheds_with_503():
+    controller = AdmissionController(
+        route_limits="GET /slow/{id}=2", queue_timeout_ms=10, client_rate=0
+    )
+    app, release = _app(controller)
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        in_flight = [asyncio.create_task(ac.get(f"/slow/{i}")) for i in range(2)]
+        await asyncio.sleep(0.05)
+        shed = await ac.get("/slow/3")
+        assert shed.status_code == 503
+        assert "retry-after" in shed.headers
+        # Other routes have their own budget
+        assert (await ac.get("/fast")).status_code == 200
+        release.set()
+        assert [r.status_code for r in await asyncio.gather(*in_flight)] == [200, 200]
+    assert controller.shed_counts["concurrency"] == 1
+
+
+@pytest.mark.asyncio
+async def test_overload_sheds_when_loop_lag_or_pool_wait_is_high():
+    controller = AdmissionController(client_rate=0, max_loop_lag_ms=100, max_pool_wait_ms=100)
+    app, _ = _app(controller)
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        controller.loop_lag.lag = 0.5
+        resp = await ac.get("/fast")
+        assert resp.status_code == 503
+        assert "event loop lag" in resp.json()["detail"]
+        controller.loop_lag.lag = 0.0
+        controller.pool_wait.average = 0.5
+        assert (await ac.get("/fast")).status_code == 503
+        controller.pool_wait.average = 0.0
+        assert (await ac.get("/fast")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_pool_wait_shedding_stops_once_the_pool_recovers():
+    controller = AdmissionController(client_rate=0, max_pool_wait_ms=100)
+    controller.pool_wait.half_life = 0.05
+    app, _ = _app(controller)
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        # A slow pool pushed the average up; shed requests never sample the pool again
+        controller.pool_wait.average = 0.4
+        assert (await ac.get("/fast")).status_code == 503
+        await asyncio.sleep(0.25)
+        assert controller.pool_wait.average < 0.1
+        assert (await ac.get("/fast")).status_code == 200
+
+
+def test_client_key_ignores_spoofable_forwarded_for():
+    scope = {
+        "client": ("10.0.0.5", 1234),
+        "headers": [(b"x-forwarded-for", b"6.6.6.6, 203.0.113.7")],
+    }
+    assert _client_key(scope) == "10.0.0.5"
+    # Behind one proxy, only the address it appended is trusted
+    assert _client_key(scope, trusted_proxies=1) == "203.0.113.7"
+    assert _client_key(scope, trusted_proxies=2) == "6.6.6.6"
+    assert _client_key({"client": ("10.0.0.5", 1), "headers": []}, trusted_proxies=1) == "10.0.0.5"
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_gives_its_slot_back_once_started():
+    controller = AdmissionController(
+        route_limits="", default_limit=1, queue_timeout_ms=10, client_rate=0
+    )
+    app, release = _app(controller)
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        download = asyncio.create_task(ac.get("/download"))
+        await asyncio.sleep(0.05)
+        # Still streaming, but no longer holding the only slot
+        assert not download.done()
+        assert (await ac.get("/fast")).status_code == 200
+        release.set()
+        assert (await download).content == b"firstrest"
+    assert controller.default_route.in_flight == 0
+
+
+def test_ignored_forwarded_for_is_reported_once(capsys):
+    controller = AdmissionController(trusted_proxies=0)
+    scope = {"client": ("10.0.0.5", 1), "headers": [(b"x-forwarded-for", b"203.0.113.7")]}
+    assert controller.client_key(scope) == controller.client_key(scope) == "10.0.0.5"
+    assert capsys.readouterr().out.count("ADMISSION_TRUSTED_PROXIES=0") == 1
+    assert AdmissionController().client_key(scope) == "203.0.113.7"
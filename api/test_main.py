@@ -10,3 +10,738 @@ async def test_healthz():
         resp = await ac.get("/healthz")
         assert resp.status_code == 200
         assert resp.json()["status"] == "ok"
+
+@pytest.mark.asyncio
+async def test_search_ranks_matches_and_counts_facets(client, make_request):
+    await make_request(title="Printer on fire", description="third floor printer", priority="high")
+    await make_request(title="VPN access", description="needs printer driver too", type="access")
+    await make_request(title="Unrelated", description="nothing to see")
+
+    resp = await client.get("/api/requests/search", params={"q": "printer"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["total"] == 2
+    assert [r["title"] for r in body["results"]] == ["Printer on fire", "VPN access"]
+    assert body["facets"]["type"] == {"bug": 1, "access": 1}
+    assert body["facets"]["status"] == {"open": 2}
+
+
+@pytest.mark.asyncio
+async def test_search_combines_text_and_filters(client, make_request):
+    await make_request(title="Printer jam", priority="high")
+    await make_request(title="Printer toner", priority="low")
+
+    resp = await client.get("/api/requests/search", params={"q": "printer", "priority": "high"})
+    body = resp.json()
+    assert body["total"] == 1
+    assert body["results"][0]["title"] == "Printer jam"
+    assert body["facets"]["priority"] == {"high": 1}
+
+    resp = await client.get("/api/requests/search", params={"q": 'printer" OR'})
+    assert resp.status_code == 200
+    assert resp.json()["total"] == 0
+
+@pytest.mark.asyncio
+async def test_patch_updates_request(client, make_request):
+    created = await make_request()
+    resp = await client.patch(f"/api/requests/{created['id']}", json={"status": "resolved", "assignee_id": None})
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "resolved"
+    resp = await client.patch("/api/requests/9999", json={"status": "resolved", "assignee_id": None})
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stats_track_creates_and_updates(client, make_request, db_engine):
+    first = await make_request(priority="high")
+    await make_request(type="access")
+    await client.patch(f"/api/requests/{first['id']}", json={"status": "resolved", "assignee_id": None})
+
+    body = (await client.get("/api/stats")).json()
+    assert body["total"] == 2
+    assert body["by_status"] == {"open": 1, "resolved": 1}
+    assert body["by_priority"] == {"high": 1, "low": 1}
+    assert body["by_type"] == {"bug": 1, "access": 1}
+    assert body["escalated"] == 0
+
+    # A rebuild from the source tables yields the same counters
+    from main import Request, RequestEscalation, RequestStat
+    from stats import rebuild_stats
+
+    async with db_engine.begin() as conn:
+        await conn.execute(RequestEscalation.__table__.insert().values(request_id=first["id"]))
+        await conn.execute(RequestStat.__table__.delete())
+        await rebuild_stats(
+            conn, RequestStat.__table__, Request.__table__, RequestEscalation.__table__
+        )
+    rebuilt = (await client.get("/api/stats")).json()
+    assert rebuilt["by_status"] == body["by_status"]
+    assert rebuilt["escalated"] == 1
+    assert rebuilt["escalation_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_first_stats_install_counts_existing_requests(tmp_path):
+    from sqlalchemy import event, select
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from main import Base, Request, RequestStat
+    from stats import ensure_stats_schema, summarize
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            # Rows written before the stats triggers existed
+            await conn.execute(
+                Request.__table__.insert(),
+                [
+                    {"title": "a", "type": "bug", "priority": "high", "status": "open"},
+                    {"title": "b", "type": "access", "priority": "low", "status": "resolved"},
+                ],
+            )
+            await ensure_stats_schema(conn)
+            rows = (await conn.execute(select(RequestStat.__table__))).all()
+            # Later startups only read the schema version: no trigger DDL, no locks
+            statements = []
+            event.listen(engine.sync_engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+            await ensure_stats_schema(conn)
+            assert len(statements) == 1
+    finally:
+        await engine.dispose()
+    stats = summarize(rows)
+    assert stats["total"] == 2
+    assert stats["by_status"] == {"open": 1, "resolved": 1}
+    assert stats["by_type"] == {"bug": 1, "access": 1}
+    assert not any(row[0] == "total" for row in rows)
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_first_response(client):
+    body = {"title": "Retry me", "description": None, "type": "bug", "priority": "low"}
+    headers = {"Idempotency-Key": "test-replay-1"}
+    first = await client.post("/api/requests", json=body, headers=headers)
+    second = await client.post("/api/requests", json=body, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len((await client.get("/api/requests")).json()) == 1
+
+    changed = await client.post("/api/requests", json={**body, "title": "Other"}, headers=headers)
+    assert changed.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_concurrent_duplicates_wait_for_first(client):
+    body = {"title": "Storm", "description": None, "type": "bug", "priority": "low"}
+    headers = {"Idempotency-Key": "test-concurrent-1"}
+    responses = await asyncio.gather(
+        *(client.post("/api/requests", json=body, headers=headers) for _ in range(5))
+    )
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert len((await client.get("/api/requests")).json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replayed_across_replicas(client):
+    import main
+    from idempotency import IdempotencyStore
+
+    body = {"title": "Other replica", "description": None, "type": "bug", "priority": "low"}
+    headers = {"Idempotency-Key": "test-replica-1"}
+    first = await client.post("/api/requests", json=body, headers=headers)
+    # A fresh store has an empty LRU, like another replica: the key table answers instead
+    original = main.idempotency_store
+    main.idempotency_store = IdempotencyStore(main.IdempotencyKey.__table__)
+    try:
+        second = await client.post("/api/requests", json=body, headers=headers)
+    finally:
+        main.idempotency_store = original
+    assert second.json()["id"] == first.json()["id"]
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replay_retries_failed_workflow_start(client):
+    import main
+    from idempotency import IdempotencyStore
+
+    started = []
+
+    class FakeClient:
+        def __init__(self, fail):
+            self.fail = fail
+
+        async def start_workflow(self, workflow, arg, id, task_queue, search_attributes=None):
+            if self.fail:
+                raise RuntimeError("temporal unavailable")
+            started.append(id)
+
+    body = {"title": "Start me", "description": None, "type": "bug", "priority": "low"}
+    headers = {"Idempotency-Key": "test-start-retry-1"}
+    original = main.idempotency_store
+    main.app.state.temporal_client = FakeClient(fail=True)
+    try:
+        first = await client.post("/api/requests", json=body, headers=headers)
+        assert "temporal unavailable" in first.headers["workflow-start-error"]
+        # Another replica sees the pending start in the key table and retries it
+        main.app.state.temporal_client = FakeClient(fail=False)
+        main.idempotency_store = IdempotencyStore(main.IdempotencyKey.__table__)
+        second = await client.post("/api/requests", json=body, headers=headers)
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert "workflow-start-error" not in second.headers
+        assert started == [f"request-{first.json()['id']}"]
+        # Once started, replays don't start it again
+        await client.post("/api/requests", json=body, headers=headers)
+        main.idempotency_store = IdempotencyStore(main.IdempotencyKey.__table__)
+        await client.post("/api/requests", json=body, headers=headers)
+        assert len(started) == 1
+    finally:
+        main.app.state.temporal_client = None
+        main.idempotency_store = original
+
+
+@pytest.mark.asyncio
+async def test_idempotency_keys_purged_in_background(db_engine):
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    import main
+    from idempotency import IdempotencyStore
+
+    table = main.IdempotencyKey.__table__
+    now = datetime.now(timezone.utc)
+    async with db_engine.begin() as conn:
+        for key, expires in (("expired", now - timedelta(seconds=1)), ("live", now + timedelta(hours=1))):
+            await conn.execute(
+                table.insert().values(key=key, fingerprint="f", created_at=now, expires_at=expires)
+            )
+    store = IdempotencyStore(table)
+    store.start_purging(sessionmaker(db_engine, class_=AsyncSession), interval=60)
+    try:
+        for _ in range(100):
+            async with db_engine.connect() as conn:
+                keys = (await conn.execute(select(table.c.key))).scalars().all()
+            if keys == ["live"]:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await store.stop_purging()
+    assert keys == ["live"]
+
+
+async def _upload(client, request_id, name="log.txt", content=b"0123456789" * 10):
+    resp = await client.post(
+        f"/api/requests/{request_id}/attachments",
+        files={"file": (name, content, "text/plain")},
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+@pytest.mark.asyncio
+async def test_attachment_listing_is_paged(client, make_request, blob_store):
+    req = await make_request()
+    uploaded = [await _upload(client, req["id"], name=f"f{i}.txt") for i in range(3)]
+    assert uploaded[0]["content_url"] == f"/api/attachments/{uploaded[0]['id']}/content"
+
+    first = (await client.get(f"/api/requests/{req['id']}/attachments", params={"limit": 2})).json()
+    assert [a["filename"] for a in first["attachments"]] == ["f0.txt", "f1.txt"]
+    rest = (
+        await client.get(
+            f"/api/requests/{req['id']}/attachments",
+            params={"limit": 2, "after": first["next_after"]},
+        )
+    ).json()
+    assert [a["filename"] for a in rest["attachments"]] == ["f2.txt"]
+    assert rest["next_after"] is None
+
+
+@pytest.mark.asyncio
+async def test_attachment_content_range_and_conditional(client, make_request, blob_store):
+    req = await make_request()
+    content = bytes(range(256)) * 4
+    att = await _upload(client, req["id"], name="dump.bin", content=content)
+    url = att["content_url"]
+
+    full = await client.get(url)
+    assert full.status_code == 200
+    assert full.content == content
+    assert full.headers["accept-ranges"] == "bytes"
+    etag = full.headers["etag"]
+
+    partial = await client.get(url, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.content == content[100:200]
+    assert partial.headers["content-range"] == f"bytes 100-199/{len(content)}"
+
+    # Resuming against a changed representation gets the whole body
+    stale = await client.get(url, headers={"Range": "bytes=100-", "If-Range": '"other"'})
+    assert stale.status_code == 200
+
+    cached = await client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+@pytest.mark.asyncio
+async def test_attachment_content_streams_remote_ranges(client, make_request, blob_store):
+    import main
+
+    req = await make_request()
+    content = b"abcdefghij" * 10
+    att = await _upload(client, req["id"], content=content)
+
+    class RemoteStore:
+        local = False
+
+        async def stream(self, key, start, length):
+            data = open(blob_store.path(key), "rb").read()[start:start + length]
+            for i in range(0, len(data), 7):
+                yield data[i:i + 7]
+
+    main.app.dependency_overrides[main.get_blob_store] = lambda: RemoteStore()
+    partial = await client.get(att["content_url"], headers={"Range": "bytes=-15"})
+    assert partial.status_code == 206
+    assert partial.content == content[-15:]
+    assert partial.headers["content-length"] == "15"
+    unsatisfiable = await client.get(att["content_url"], headers={"Range": "bytes=500-"})
+    assert unsatisfiable.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_attachment_content_missing(client, blob_store):
+    assert (await client.get("/api/attachments/999/content")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_request_embeds_attachments(client, make_request, blob_store):
+    req = await make_request(title="With files")
+    await _upload(client, req["id"], name="a.txt")
+    await _upload(client, req["id"], name="b.txt")
+
+    resp = await client.get(f"/api/requests/{req['id']}")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["title"] == "With files"
+    assert [a["filename"] for a in body["attachments"]] == ["a.txt", "b.txt"]
+    # Cosmos isn't configured in tests, so events are reported as unavailable
+    assert body["events"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_request_include_selects_parts(client, make_request):
+    req = await make_request()
+    body = (await client.get(f"/api/requests/{req['id']}", params={"include": ""})).json()
+    assert "attachments" not in body and "events" not in body
+    body = (await client.get(f"/api/requests/{req['id']}", params={"include": "attachments"})).json()
+    assert body["attachments"] == [] and "events" not in body
+    assert (await client.get(f"/api/requests/{req['id']}", params={"include": "x"})).status_code == 422
+    assert (await client.get("/api/requests/999")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_request_reads_latest_events(client, make_request):
+    import main
+
+    class FakeContainer:
+        def query_items(self, query, parameters, partition_key):
+            self.query, self.parameters = query, parameters
+
+            async def items():
+                yield {"eventType": "escalated"}
+                yield {"eventType": "created"}
+
+            return items()
+
+    req = await make_request()
+    container = FakeContainer()
+    main.app.state.cosmos_container = container
+    try:
+        body = (
+            await client.get(f"/api/requests/{req['id']}", params={"include": "events", "events_limit": 2})
+        ).json()
+    finally:
+        main.app.state.cosmos_container = None
+    assert [e["eventType"] for e in body["events"]] == ["escalated", "created"]
+    assert {"name": "@limit", "value": 2} in container.parameters
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_by_ids_reports_each_item(client, make_request):
+    a = await make_request(title="a")
+    b = await make_request(title="b")
+    resp = await client.patch(
+        "/api/requests:bulk", json={"ids": [a["id"], b["id"], 999], "status": "resolved"}
+    )
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["updated"] == 2
+    by_id = {r["id"]: r for r in body["results"]}
+    assert by_id[a["id"]]["ok"] and by_id[a["id"]]["request"]["status"] == "resolved"
+    assert by_id[999] == {
+        "id": 999, "ok": False, "error": "Request not found", "request": None, "signal_error": None
+    }
+    stats = (await client.get("/api/stats")).json()
+    assert stats["by_status"].get("resolved") == 2
+
+
+@pytest.mark.asyncio
+async def test_create_starts_workflow_without_unregistered_search_attributes(client):
+    import main
+
+    calls = []
+
+    class FakeClient:
+        def __init__(self, fail_always):
+            self.fail_always = fail_always
+
+        async def start_workflow(self, workflow, arg, id, task_queue, search_attributes=None):
+            calls.append((id, search_attributes is not None))
+            if search_attributes is not None or self.fail_always:
+                raise RuntimeError("search attribute RequestStatus is not defined")
+
+    body = {"title": "Printer", "description": None, "type": "bug", "priority": "low"}
+    main.app.state.temporal_client = FakeClient(fail_always=False)
+    try:
+        resp = await client.post("/api/requests", json=body)
+        assert resp.status_code == 200
+        assert "workflow-start-error" not in resp.headers
+        req_id = resp.json()["id"]
+        assert calls == [(f"request-{req_id}", True), (f"request-{req_id}", False)]
+        # A start that still fails is reported, not just logged
+        main.app.state.temporal_client = FakeClient(fail_always=True)
+        resp = await client.post("/api/requests", json=body)
+        assert resp.status_code == 200
+        assert "is not defined" in resp.headers["workflow-start-error"]
+    finally:
+        main.app.state.temporal_client = None
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_by_filter_signals_workflows(client, make_request):
+    import main
+
+    signalled = []
+
+    class FakeHandle:
+        def __init__(self, workflow_id):
+            self.workflow_id = workflow_id
+
+        async def signal(self, name, payload):
+            signalled.append((self.workflow_id, name, payload))
+
+    class FakeClient:
+        def get_workflow_handle(self, workflow_id):
+            return FakeHandle(workflow_id)
+
+    high = await make_request(priority="high")
+    await make_request(priority="low")
+    main.app.state.temporal_client = FakeClient()
+    try:
+        resp = await client.patch(
+            "/api/requests:bulk", json={"filter": {"priority": ["high"]}, "assignee_id": None}
+        )
+    finally:
+        main.app.state.temporal_client = None
+    body = resp.json()
+    assert body["updated"] == 1
+    assert signalled == [
+        (f"request-{high['id']}", "request_updated", {"status": "open", "assignee_id": None})
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_validation(client):
+    assert (await client.patch("/api/requests:bulk", json={"ids": [1]})).status_code == 422
+    assert (
+        await client.patch("/api/requests:bulk", json={"filter": {}, "status": "resolved"})
+    ).status_code == 422
+    assert (
+        await client.patch(
+            "/api/requests:bulk", json={"ids": [1], "filter": {"type": ["bug"]}, "status": "open"}
+        )
+    ).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_resolved_requests(client, make_request, db_engine, blob_store):
+    from datetime import timedelta
+    from sqlalchemy import func, select, update
+
+    from archive import archive_resolved
+    from main import (
+        Attachment, AttachmentArchive, Request, RequestArchive, RequestEscalation, RequestStat
+    )
+    from stats import rebuild_stats
+
+    old = [await make_request(title=f"old {i}") for i in range(3)]
+    recent = await make_request(title="recent")
+    with_file = await make_request(title="has attachment")
+    await _upload(client, with_file["id"])
+    ids = [r["id"] for r in old] + [recent["id"], with_file["id"]]
+    await client.patch("/api/requests:bulk", json={"ids": ids, "status": "resolved"})
+    t = Request.__table__
+    async with db_engine.begin() as conn:
+        await conn.execute(
+            update(t)
+            .where(t.c.id.in_([r["id"] for r in old] + [with_file["id"]]))
+            .values(updated_at=func.datetime("now", "-200 days"))
+        )
+    before = (await client.get("/api/stats")).json()
+
+    result = await archive_resolved(
+        db_engine,
+        t,
+        RequestArchive.__table__,
+        Attachment.__table__,
+        AttachmentArchive.__table__,
+        older_than=timedelta(days=90),
+        batch_size=2,
+    )
+    assert result == {"moved": 4, "batches": 3}
+    async with db_engine.connect() as conn:
+        hot = (await conn.execute(select(t.c.id).order_by(t.c.id))).scalars().all()
+        archived = (await conn.execute(select(RequestArchive.__table__.c.id))).scalars().all()
+        files = (await conn.execute(select(AttachmentArchive.__table__))).mappings().all()
+        left = (await conn.execute(select(func.count()).select_from(Attachment.__table__))).scalar()
+    assert hot == [recent["id"]]
+    assert sorted(archived) == [r["id"] for r in old] + [with_file["id"]]
+    # Attachments move with their request instead of keeping it hot
+    assert [(f["request_id"], f["filename"]) for f in files] == [(with_file["id"], "log.txt")]
+    assert left == 0
+    # Counters still cover archived requests, and a rebuild agrees
+    assert (await client.get("/api/stats")).json() == before
+    async with db_engine.begin() as conn:
+        await rebuild_stats(
+            conn,
+            RequestStat.__table__,
+            t,
+            RequestEscalation.__table__,
+            RequestArchive.__table__,
+        )
+    assert (await client.get("/api/stats")).json() == before
+
+
+@pytest.mark.asyncio
+async def test_ops_workflows_reads_temporal_visibility(client):
+    import base64
+    from types import SimpleNamespace
+
+    import main
+    from temporalio.client import WorkflowExecutionStatus
+    from temporalio.common import SearchAttributePair, TypedSearchAttributes
+
+    import search_attributes as wf_attrs
+
+    calls = []
+
+    class FakeExecutions:
+        def __init__(self, query, page_size, next_page_token):
+            calls.append((query, page_size, next_page_token))
+            self.current_page = None
+            self.next_page_token = None
+
+        async def fetch_next_page(self):
+            self.current_page = [
+                SimpleNamespace(
+                    id="request-7",
+                    run_id="r1",
+                    status=WorkflowExecutionStatus.RUNNING,
+                    start_time=None,
+                    typed_search_attributes=TypedSearchAttributes([
+                        SearchAttributePair(wf_attrs.STATUS, "open"),
+                        SearchAttributePair(wf_attrs.PRIORITY, "high"),
+                        SearchAttributePair(wf_attrs.ESCALATED, True),
+                    ]),
+                )
+            ]
+            self.next_page_token = b"\x01next"
+
+    class FakeClient:
+        def list_workflows(self, query, page_size, next_page_token):
+            return FakeExecutions(query, page_size, next_page_token)
+
+    assert (await client.get("/api/ops/workflows")).status_code == 503
+    main.app.state.temporal_client = FakeClient()
+    try:
+        resp = await client.get(
+            "/api/ops/workflows",
+            params={"status": "open", "priority": "high", "overdue": "true", "limit": 10},
+        )
+        body = resp.json()
+        assert resp.status_code == 200
+        assert body["workflows"] == [
+            {
+                "workflow_id": "request-7",
+                "run_id": "r1",
+                "request_id": 7,
+                "execution_status": "RUNNING",
+                "start_time": None,
+                "status": "open",
+                "priority": "high",
+                "type": None,
+                "sla_deadline": None,
+                "escalated": True,
+            }
+        ]
+        query, page_size, token = calls[0]
+        assert "RequestStatus = 'open' AND RequestPriority = 'high'" in query
+        assert "SlaDeadline < '" in query
+        assert (page_size, token) == (10, None)
+        # The returned token resumes from the next visibility page
+        await client.get("/api/ops/workflows", params={"page_token": body["next_page_token"]})
+        assert calls[1][2] == base64.urlsafe_b64decode(body["next_page_token"]) == b"\x01next"
+    finally:
+        main.app.state.temporal_client = None
+
+
+@pytest.mark.asyncio
+async def test_admin_profile_requires_token(client, monkeypatch):
+    import main
+
+    assert (await client.get("/api/admin/profile")).status_code == 404
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    resp = await client.get("/api/admin/profile", headers={"X-Admin-Token": "wrong"})
+    assert resp.status_code == 403
+    resp = await client.get(
+        "/api/admin/profile",
+        params={"seconds": 0.05, "interval_ms": 1},
+        headers={"X-Admin-Token": "secret"},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert resp.text.strip()
+
+
+@pytest.mark.asyncio
+async def test_events_after_seq_reads_only_newer_events(client):
+    import main
+
+    events = [{"id": f"e{i}", "requestId": "5", "eventType": "x", "seq": i} for i in (1, 2, 3)]
+
+    class FakePages:
+        continuation_token = None
+
+        def __init__(self, items):
+            self._pages = [items]
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self._pages:
+                raise StopAsyncIteration
+            page = self._pages.pop(0)
+
+            async def items():
+                for item in page:
+                    yield item
+
+            return items()
+
+    class FakeContainer:
+        def query_items(self, query, parameters, partition_key, max_item_count):
+            self.query, self.parameters = query, parameters
+            params = {p["name"]: p["value"] for p in parameters}
+            after = params.get("@afterSeq", 0)
+            # Stands in for the server evaluating the filter
+            matched = [e for e in events if e["requestId"] == params["@requestId"] and e["seq"] > after]
+
+            class Query:
+                def by_page(self, continuation_token=None):
+                    return FakePages(matched[:max_item_count])
+
+            return Query()
+
+    container = FakeContainer()
+    main.app.state.cosmos_container = container
+    try:
+        body = (await client.get("/api/requests/5/events", params={"afterSeq": 1})).json()
+        assert [e["seq"] for e in body["events"]] == [2, 3]
+        assert body["lastSeq"] == 3
+        assert "c.seq > @afterSeq" in container.query
+        assert "ORDER BY c.requestId ASC, c.seq ASC" in container.query
+        # Nothing new since the last read: the cursor stays put
+        body = (await client.get("/api/requests/5/events", params={"afterSeq": 3})).json()
+        assert (body["events"], body["lastSeq"]) == ([], 3)
+    finally:
+        main.app.state.cosmos_container = None
+
+
+@pytest.mark.asyncio
+async def test_events_fall_back_to_seq_order_without_composite_index(client, make_request):
+    import main
+    from azure.cosmos.exceptions import CosmosHttpResponseError
+
+    queries = []
+    event = {"id": "e1", "eventType": "created", "seq": 1}
+
+    async def results(query):
+        if "c.requestId" in query.split("ORDER BY")[1]:
+            raise CosmosHttpResponseError(
+                status_code=400,
+                message="The order by query does not have a corresponding composite index",
+            )
+        yield event
+
+    class Pages:
+        continuation_token = None
+
+        def __init__(self, query):
+            self.pages = [results(query)]
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self.pages:
+                raise StopAsyncIteration
+            return self.pages.pop()
+
+    class FakeContainer:
+        def query_items(self, query, parameters, partition_key, max_item_count=None):
+            queries.append(query)
+
+            class Query:
+                def by_page(self, continuation_token=None):
+                    return Pages(query)
+
+                def __aiter__(self):
+                    return results(query)
+
+            return Query()
+
+    req = await make_request()
+    main.app.state.cosmos_container = FakeContainer()
+    try:
+        timeline = (await client.get(f"/api/requests/{req['id']}/events")).json()
+        detail = (await client.get(f"/api/requests/{req['id']}", params={"include": "events"})).json()
+    finally:
+        main.app.state.cosmos_container = None
+    assert timeline["events"] == detail["events"] == [event]
+    assert [q.split("ORDER BY ")[1] for q in queries] == [
+        "c.requestId ASC, c.seq ASC", "c.seq ASC", "c.requestId DESC, c.seq DESC", "c.seq DESC"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_filter_is_capped(client, make_request, monkeypatch):
+    import main
+
+    for _ in range(3):
+        await make_request(priority="high")
+    monkeypatch.setattr(main, "BULK_MAX_IDS", 2)
+    resp = await client.patch(
+        "/api/requests:bulk", json={"filter": {"priority": ["high"]}, "status": "resolved"}
+    )
+    assert resp.status_code == 422
+    # Nothing was changed
+    listed = (await client.get("/api/requests")).json()
+    assert {r["status"] for r in listed} == {"open"}
+    monkeypatch.setattr(main, "BULK_MAX_IDS", 3)
+    resp = await client.patch(
+        "/api/requests:bulk", json={"filter": {"priority": ["high"]}, "status": "resolved"}
+    )
+    assert resp.json()["updated"] == 3
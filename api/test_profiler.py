@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from profiler import LoopLagMonitor, ProfilerBusy, SamplingProfiler
+
+
+def _spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.mark.asyncio
+async def test_profile_collapses_thread_stacks():
+    stop = threading.Event()
+    thread = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    thread.start()
+    try:
+        collapsed = await SamplingProfiler(interval_ms=1).profile(0.2)
+    finally:
+        stop.set()
+        thread.join()
+    spinner = [line for line in collapsed.splitlines() if line.startswith("spinner;")]
+    assert spinner and all("_spin (test_profiler.py:" in line for line in spinner)
+    stack, count = spinner[0].rsplit(" ", 1)
+    # Frames run root first, after the thread name
+    frames = stack.split(";")
+    assert frames[0] == "spinner" and any(f.startswith("_spin ") for f in frames[1:])
+    assert int(count) > 0
+
+
+@pytest.mark.asyncio
+async def test_one_profile_at_a_time():
+    profiler = SamplingProfiler(interval_ms=1)
+    running = asyncio.create_task(profiler.profile(0.2))
+    await asyncio.sleep(0.05)
+    with pytest.raises(ProfilerBusy):
+        await profiler.profile(0.1)
+    assert await running
+
+
+def _block_loop(seconds: float):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_loop_stall_logs_blocking_stack():
+    stalls = []
+    monitor = LoopLagMonitor(
+        interval=0.01, stall_threshold=0.05, on_stall=lambda blocked, stack: stalls.append((blocked, stack))
+    )
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        assert stalls == []
+        _block_loop(0.3)
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+    # One report per stall, naming the call that held the loop
+    assert len(stalls) == 1
+    blocked, stack = stalls[0]
+    assert blocked > 0.05
+    assert stack[-1].startswith("_block_loop (test_profiler.py:")
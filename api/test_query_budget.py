@@ -0,0 +1,179 @@
+"""Per-endpoint SQL budgets: a regression that adds queries (an N+1, a re-read after a write)
+fails here with the offending statements listed.
+
+Budgets count statements sent by the app and round-trips (statements plus COMMIT/ROLLBACK).
+Work done by database triggers is not counted.
+"""
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_healthz_budget(client, query_budget):
+    with query_budget.budget(statements=0, round_trips=0):
+        assert (await client.get("/healthz")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_create_budget(client, query_budget):
+    body = {"title": "Budget", "description": None, "type": "bug", "priority": "low"}
+    with query_budget.budget(statements=1, round_trips=2):
+        assert (await client.post("/api/requests", json=body)).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_create_with_idempotency_key_budget(client, query_budget):
+    import main
+    from idempotency import IdempotencyStore
+
+    original_store = main.idempotency_store
+    body = {"title": "Budget", "description": None, "type": "bug", "priority": "low"}
+    headers = {"Idempotency-Key": "budget-1"}
+    main.app.state.temporal_client = _FakeTemporal()
+    try:
+        with query_budget.budget(statements=3, round_trips=4):
+            resp = await client.post("/api/requests", json=body, headers=headers)
+        assert resp.status_code == 200
+        # A replay on the same replica doesn't check out a connection
+        with query_budget.budget(statements=0, round_trips=0):
+            resp = await client.post("/api/requests", json=body, headers=headers)
+        assert resp.headers["Idempotent-Replayed"] == "true"
+        # Another replica tries the claim, then reads the stored response
+        main.idempotency_store = IdempotencyStore(main.IdempotencyKey.__table__)
+        with query_budget.budget(statements=2, round_trips=3):
+            resp = await client.post("/api/requests", json=body, headers=headers)
+        assert resp.headers["Idempotent-Replayed"] == "true"
+    finally:
+        main.app.state.temporal_client = None
+        main.idempotency_store = original_store
+
+
+@pytest.mark.asyncio
+async def test_list_budget(client, make_request, query_budget):
+    for _ in range(5):
+        await make_request()
+    with query_budget.budget(statements=1, round_trips=2):
+        assert len((await client.get("/api/requests")).json()) == 5
+
+
+@pytest.mark.asyncio
+async def test_search_budget(client, make_request, query_budget):
+    for i in range(5):
+        await make_request(title=f"printer jam {i}")
+    with query_budget.budget(statements=1, round_trips=2):
+        resp = await client.get("/api/requests/search", params={"q": "printer"})
+    assert resp.json()["total"] == 5
+
+
+@pytest.mark.asyncio
+async def test_get_request_budget(client, make_request, blob_store, query_budget):
+    req = await make_request()
+    for i in range(3):
+        files = {"file": (f"f{i}.txt", b"x", "text/plain")}
+        await client.post(f"/api/requests/{req['id']}/attachments", files=files)
+    # Attachments are joined into the request query, not loaded one by one
+    with query_budget.budget(statements=1, round_trips=2):
+        resp = await client.get(f"/api/requests/{req['id']}")
+    assert len(resp.json()["attachments"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_update_budget(client, make_request, query_budget):
+    req = await make_request()
+    with query_budget.budget(statements=1, round_trips=2):
+        resp = await client.patch(
+            f"/api/requests/{req['id']}", json={"status": "in_progress", "assignee_id": None}
+        )
+    assert resp.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_budget(client, make_request, query_budget):
+    ids = [(await make_request())["id"] for _ in range(10)]
+    with query_budget.budget(statements=1, round_trips=2):
+        resp = await client.patch("/api/requests:bulk", json={"ids": ids, "status": "resolved"})
+    assert resp.json()["updated"] == 10
+
+
+@pytest.mark.asyncio
+async def test_stats_budget(client, make_request, query_budget):
+    await make_request()
+    with query_budget.budget(statements=1, round_trips=2):
+        assert (await client.get("/api/stats")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_attachment_budgets(client, make_request, blob_store, query_budget):
+    req = await make_request()
+    files = {"file": ("notes.txt", b"hello", "text/plain")}
+    with query_budget.budget(statements=1, round_trips=2):
+        att = (await client.post(f"/api/requests/{req['id']}/attachments", files=files)).json()
+    for _ in range(2):
+        await client.post(f"/api/requests/{req['id']}/attachments", files=files)
+    with query_budget.budget(statements=1, round_trips=2):
+        page = (await client.get(f"/api/requests/{req['id']}/attachments")).json()
+    assert len(page["attachments"]) == 3
+    with query_budget.budget(statements=1, round_trips=2):
+        assert (await client.get(f"/api/attachments/{att['id']}/content")).content == b"hello"
+
+
+class _FakeExecutions:
+    current_page = None
+    next_page_token = None
+
+    async def fetch_next_page(self):
+        self.current_page = []
+
+
+class _FakeTemporal:
+    async def start_workflow(self, workflow, arg, id, task_queue, search_attributes=None):
+        pass
+
+    def list_workflows(self, query, page_size, next_page_token):
+        return _FakeExecutions()
+
+
+class _FakeEventPages:
+    continuation_token = None
+
+    def __init__(self):
+        self._pages = [[{"id": "e1", "requestId": "1", "eventType": "created", "seq": 1}]]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._pages:
+            raise StopAsyncIteration
+        page = self._pages.pop(0)
+
+        async def items():
+            for item in page:
+                yield item
+
+        return items()
+
+
+class _FakeCosmos:
+    def query_items(self, query, parameters, partition_key, max_item_count):
+        class Query:
+            def by_page(self, continuation_token=None):
+                return _FakeEventPages()
+
+        return Query()
+
+
+@pytest.mark.asyncio
+async def test_temporal_and_cosmos_endpoints_skip_sql(client, query_budget):
+    import main
+
+    main.app.state.temporal_client = _FakeTemporal()
+    main.app.state.cosmos_container = _FakeCosmos()
+    try:
+        with query_budget.budget(statements=0, round_trips=0):
+            assert (await client.get("/api/ops/workflows")).status_code == 200
+            resp = await client.get("/api/requests/1/events")
+        assert resp.status_code == 200
+        assert resp.json()["lastSeq"] == 1
+    finally:
+        main.app.state.temporal_client = None
+        main.app.state.cosmos_container = None
@@ -0,0 +1,192 @@
+"""SQLite-backed history of test failures across report runs.
+
+Each processed report is ingested as one run, keyed by the GitHub Actions run id, with one row
+per failing test. Runs get an increasing ``seq`` so "the last N runs" is a range on an index:
+
+- ``failures (run_seq, test_name)`` serves the windowed aggregations (forced with
+  ``INDEXED BY``: without statistics SQLite would rather scan the primary key in group order);
+- the primary key ``(test_name, run_seq)`` answers "did this test fail before run X?" with a
+  single index probe, which is what makes "newly flaky since X" cheap.
+
+Re-ingesting a run id replaces that run's rows, so reruns of the report are idempotent.
+"""
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL UNIQUE,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    test_name TEXT NOT NULL,
+    run_seq INTEGER NOT NULL REFERENCES runs(seq),
+    category TEXT NOT NULL,
+    failure_count INTEGER NOT NULL,
+    PRIMARY KEY (test_name, run_seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS failures_by_run ON failures (run_seq, test_name);
+"""
+
+# Rows buffered before an executemany round
+BATCH_SIZE = 1000
+
+
+@dataclass
+class TestTrend:
+    name: str
+    failed_runs: int
+    failures: int
+    window: int
+
+    @property
+    def rate(self) -> float:
+        return self.failed_runs / self.window if self.window else 0.0
+
+
+@dataclass
+class Trends:
+    window: int
+    top_flaky: list[TestTrend] = field(default_factory=list)
+    since_run: Optional[str] = None
+    newly_flaky: list[TestTrend] = field(default_factory=list)
+
+
+class FailureHistory:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self._run_seq: Optional[int] = None
+        self._pending: list[tuple[str, int, str, int]] = []
+
+    def begin_run(self, run_id: str) -> int:
+        """Start (or restart) ingesting ``run_id``; later ``add`` calls belong to it."""
+        now = datetime.now(timezone.utc).isoformat()
+        seq = self.conn.execute(
+            "INSERT INTO runs (run_id, ingested_at) VALUES (?, ?) "
+            "ON CONFLICT (run_id) DO UPDATE SET ingested_at = excluded.ingested_at "
+            "RETURNING seq",
+            (run_id, now),
+        ).fetchone()[0]
+        self.conn.execute("DELETE FROM failures WHERE run_seq = ?", (seq,))
+        self._run_seq = seq
+        return seq
+
+    def add(self, test_name: str, category: str, failure_count: int):
+        if self._run_seq is None:
+            raise RuntimeError("begin_run() must be called before add()")
+        self._pending.append((test_name, self._run_seq, category, int(failure_count)))
+        if len(self._pending) >= BATCH_SIZE:
+            self._flush()
+
+    def finish_run(self):
+        self._flush()
+        self.conn.commit()
+        self._run_seq = None
+
+    def previous_run(self, run_id: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT run_id FROM runs WHERE seq < (SELECT seq FROM runs WHERE run_id = ?) "
+            "ORDER BY seq DESC LIMIT 1",
+            (run_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def top_flaky(self, last_runs: int = 10, limit: int = 10) -> tuple[int, list[TestTrend]]:
+        """Tests failing in the most of the last ``last_runs`` runs, with the window size."""
+        first_seq, window = self._window(last_runs)
+        rows = self.conn.execute(
+            "SELECT test_name, COUNT(*) AS failed_runs, SUM(failure_count) AS failures "
+            "FROM failures INDEXED BY failures_by_run WHERE run_seq >= ? GROUP BY test_name "
+            "ORDER BY failed_runs DESC, failures DESC, test_name LIMIT ?",
+            (first_seq, limit),
+        )
+        return window, [TestTrend(name, runs, total, window) for name, runs, total in rows]
+
+    def newly_flaky(self, since_run_id: str, limit: int = 10) -> list[TestTrend]:
+        """Tests failing after ``since_run_id`` that never failed in it or any earlier run."""
+        since = self.conn.execute(
+            "SELECT seq FROM runs WHERE run_id = ?", (since_run_id,)
+        ).fetchone()
+        if since is None:
+            return []
+        since_seq = since[0]
+        window = self.conn.execute(
+            "SELECT COUNT(*) FROM runs WHERE seq > ?", (since_seq,)
+        ).fetchone()[0]
+        rows = self.conn.execute(
+            "SELECT f.test_name, COUNT(*) AS failed_runs, SUM(f.failure_count) AS failures "
+            "FROM failures AS f INDEXED BY failures_by_run WHERE f.run_seq > ? AND NOT EXISTS ("
+            "  SELECT 1 FROM failures p WHERE p.test_name = f.test_name AND p.run_seq <= ?"
+            ") GROUP BY f.test_name ORDER BY failed_runs DESC, failures DESC, f.test_name LIMIT ?",
+            (since_seq, since_seq, limit),
+        )
+        return [TestTrend(name, runs, total, window) for name, runs, total in rows]
+
+    def trends(
+        self,
+        last_runs: int = 10,
+        since_run_id: Optional[str] = None,
+        limit: int = 10,
+    ) -> Trends:
+        window, top = self.top_flaky(last_runs, limit)
+        trends = Trends(window=window, top_flaky=top, since_run=since_run_id)
+        if since_run_id:
+            trends.newly_flaky = self.newly_flaky(since_run_id, limit)
+        return trends
+
+    def close(self):
+        # A run that never reached finish_run() is rolled back
+        self.conn.close()
+
+    def _flush(self):
+        if self._pending:
+            # A test can appear in several records of one run; add their counts up
+            self.conn.executemany(
+                "INSERT INTO failures (test_name, run_seq, category, failure_count) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (test_name, run_seq) "
+                "DO UPDATE SET failure_count = failure_count + excluded.failure_count",
+                self._pending,
+            )
+            self._pending.clear()
+
+    def _window(self, last_runs: int) -> tuple[int, int]:
+        rows = self.conn.execute(
+            "SELECT seq FROM runs ORDER BY seq DESC LIMIT ?", (max(last_runs, 1),)
+        ).fetchall()
+        if not rows:
+            return 0, 0
+        return rows[-1][0], len(rows)
+
+
+def iter_trends_markdown(trends: Trends) -> Iterator[str]:
+    yield f"### 📉 Flakiest Tests - Last {trends.window} Runs\n\n"
+    if not trends.top_flaky:
+        yield "No failures recorded in this window.\n\n"
+    else:
+        yield "| Test | Failed Runs | Failures |\n"
+        yield "|------|-------------|----------|\n"
+        for t in trends.top_flaky:
+            yield f"| `{t.name}` | {t.failed_runs}/{t.window} ({t.rate:.0%}) | {t.failures} |\n"
+        yield "\n"
+    if trends.since_run:
+        yield f"### 🆕 Newly Flaky Since Run {trends.since_run}\n\n"
+        if not trends.newly_flaky:
+            yield "None.\n\n"
+        else:
+            for t in trends.newly_flaky:
+                yield f"- `{t.name}` ({t.failures} failures in {t.failed_runs} runs)\n"
+            yield "\n"
+
+
+def format_trends_slack(trends: Trends, max_items: int = 5) -> str:
+    lines = [
+        f"• {t.failed_runs}/{t.window} runs: `{t.name}`" for t in trends.top_flaky[:max_items]
+    ]
+    if trends.newly_flaky:
+        names = ", ".join(f"`{t.name}`" for t in trends.newly_flaky[:max_items])
+        lines.append(f"🆕 Newly flaky: {names}")
+    return "\n".join(lines)
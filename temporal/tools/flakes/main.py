@@ -1,111 +1,176 @@
 import argparse
 import json
 import os
+import re
 import sys
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
 
 import requests
 
+from history import FailureHistory, Trends, format_trends_slack, iter_trends_markdown
 
-def process_tests(data, pattern, output_file: str):
-    lines = []
-    lines.append(f"|{pattern}, Name with Url|Count|\n")
-    lines.append("| -------- | ------- |\n")
-
-    for item in data:
-        name_parts = item["name"].split("/")
-        if len(name_parts) < 2:
-            continue
-        if not item["name"].endswith(pattern):
-            continue
-
-        parts = item["artifact"].split("--")
-        if len(parts) > 0 and len(parts[1]) > 0 and len(parts[2]) > 0:
-            p2 = parts[2]
-            if p2 == "unknown":
-                job_url = (
-                    f"https://github.com/temporalio/temporal/actions/runs/{parts[1]}"
-                )
-            else:
-                job_url = f"https://github.com/temporalio/temporal/actions/runs/{parts[1]}/job/{p2}"
-        else:
-            job_url = item["artifact"]
-
-        lines.append(f"|[{item['name']}]({job_url})|{item['failure_count']}|\n")
-
-    with open(output_file, "w") as outfile:
-        outfile.writelines(lines)
-
-
-def process_crash(data, pattern, output_file: str):
-    lines = []
-    lines.append(f"|{pattern}, Name with Url|Count|\n")
-    lines.append("| -------- | ------- |\n")
-
-    for item in data:
-        if "crash" in item["name"]:
-            job_url = ""
-            parts = item["artifact"].split("--")
-            if len(parts) > 0 and len(parts[1]) > 0:
-                job_url = (
-                    f"https://github.com/temporalio/temporal/actions/runs/{parts[1]}"
-                )
-            else:
-                job_url = item["artifact"]
-            lines.append(f"|[{item['name']}]({job_url})|{item['failure_count']}|\n")
-
-    with open(output_file, "w") as outfile:
-        outfile.writelines(lines)
-
-
-def process_flaky(data, output_file: str):
-    transformed = []
-    for item in data:
-        name_parts = item["name"].split("/")
-        if len(name_parts) < 2:
-            continue
-        parts = item["artifact"].split("--")
-        if len(parts) > 0 and len(parts[1]) > 0 and len(parts[2]) > 0:
-            p2 = parts[2]
-            if p2 == "unknown":
-                job_url = (
-                    f"https://github.com/temporalio/temporal/actions/runs/{parts[1]}"
-                )
-            else:
-                job_url = f"https://github.com/temporalio/temporal/actions/runs/{parts[1]}/job/{p2}"
-        else:
-            job_url = item["artifact"]
 
-        transformed.append(
-            {
-                "name": item["name"],  # the 'name' field from the original
-                "job_url": job_url,  # the newly constructed job URL
-                "count": item["failure_count"],  # store the failure_count
-            }
-        )
+GITHUB_RUNS_URL = "https://github.com/temporalio/temporal/actions/runs"
+# Rows kept in the flaky report (and its Slack version)
+FLAKY_REPORT_LIMIT = 11
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that can follow an array element; a number is only complete once one is seen
+_ELEMENT_END = frozenset(",] \t\n\r")
 
-        if len(transformed) > 10:
-            break
 
-    # Write both markdown table (for GitHub) and plain text (for Slack)
-    lines = []
-    lines.append("|Name with Url|Count|\n")
-    lines.append("| -------- | ------- |\n")
-    for item in transformed:
-        lines.append(f"|[{item['name']}]({item['job_url']})|{item['count']}|\n")
+def iter_json_array(file: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array without loading the whole document.
 
-    with open(output_file, "w") as outfile:
-        outfile.writelines(lines)
+    The file is read in chunks and each element is decoded with ``raw_decode`` as soon as it
+    is complete, so memory stays proportional to the largest element, not the file.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
 
-    # Also create a plain text version for Slack
-    slack_file = output_file.replace(".txt", "_slack.txt")
-    slack_lines = []
-    for item in transformed:
-        slack_lines.append(f"• {item['count']} failures: `{item['name']}`\n")
+    def read_more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        # Grow reads with the pending element so a huge element isn't re-parsed per chunk
+        chunk = file.read(max(chunk_size, len(buf) - pos))
+        if not chunk:
+            eof = True
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
 
-    with open(slack_file, "w") as outfile:
-        outfile.writelines(slack_lines)
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            pos = _JSON_WHITESPACE.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if not read_more():
+                raise json.JSONDecodeError("Unexpected end of input", buf, pos)
+
+    if next_char() != "[":
+        raise json.JSONDecodeError("Expected a JSON array", buf, pos)
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if read_more():
+                    continue
+                raise
+            # A number cut by the chunk edge ("1" of "1.5") decodes early; wait for a delimiter
+            if (
+                not isinstance(item, (dict, list, str))
+                and (end == len(buf) or buf[end] not in _ELEMENT_END)
+                and read_more()
+            ):
+                continue
+            break
+        pos = end
+        yield item
+        delimiter = next_char()
+        pos += 1
+        if delimiter == "]":
+            return
+        if delimiter != ",":
+            raise json.JSONDecodeError("Expected ',' or ']'", buf, pos - 1)
+
+
+def job_urls(artifact: str) -> tuple[str, str]:
+    """Return ``(job_url, run_url)`` for an artifact name like ``prefix--<run>--<job>``."""
+    parts = artifact.split("--")
+    run_id = parts[1] if len(parts) > 1 else ""
+    job_id = parts[2] if len(parts) > 2 else ""
+    run_url = f"{GITHUB_RUNS_URL}/{run_id}" if run_id else artifact
+    if not (run_id and job_id):
+        return artifact, run_url
+    if job_id == "unknown":
+        return run_url, run_url
+    return f"{GITHUB_RUNS_URL}/{run_id}/job/{job_id}", run_url
+
+
+def failure_category(name: str) -> str:
+    if "crash" in name:
+        return "crash"
+    if name.endswith("(timeout)"):
+        return "timeout"
+    if name.endswith("(retry 2)"):
+        return "retry"
+    return "flaky"
+
+
+class MarkdownTable:
+    """A ``|Name with Url|Count|`` table written row by row."""
+
+    def __init__(self, output_file: str, title: str):
+        self.rows = 0
+        self._file = open(output_file, "w")
+        self._file.write(f"|{title}|Count|\n")
+        self._file.write("| -------- | ------- |\n")
+
+    def add(self, name: str, url: str, count: Any):
+        self._file.write(f"|[{name}]({url})|{count}|\n")
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class FlakesReport:
+    """Classifies each test record into every report in a single pass.
+
+    Writes ``flaky.txt`` (plus ``flaky_slack.txt`` for Slack), ``timeout.txt``, ``retry.txt``
+    and ``crash.txt`` under ``out_dir`` as records arrive, and records each failure in
+    ``history`` when one is given.
+    """
+
+    def __init__(self, out_dir: str = "out", history: Optional[FailureHistory] = None):
+        self.history = history
+        self.flaky = MarkdownTable(os.path.join(out_dir, "flaky.txt"), "Name with Url")
+        self.timeout = MarkdownTable(
+            os.path.join(out_dir, "timeout.txt"), "(timeout), Name with Url"
+        )
+        self.retry = MarkdownTable(os.path.join(out_dir, "retry.txt"), "(retry 2), Name with Url")
+        self.crash = MarkdownTable(os.path.join(out_dir, "crash.txt"), "(crash), Name with Url")
+        self._flaky_slack = open(os.path.join(out_dir, "flaky_slack.txt"), "w")
+
+    def add(self, item: Dict[str, Any]):
+        name = item["name"]
+        count = item["failure_count"]
+        job_url, run_url = job_urls(item["artifact"])
+        if self.history is not None:
+            self.history.add(name, failure_category(name), count)
+        if "crash" in name:
+            self.crash.add(name, run_url, count)
+        if "/" not in name:
+            return
+        if self.flaky.rows < FLAKY_REPORT_LIMIT:
+            self.flaky.add(name, job_url, count)
+            self._flaky_slack.write(f"• {count} failures: `{name}`\n")
+        if name.endswith("(timeout)"):
+            self.timeout.add(name, job_url, count)
+        elif name.endswith("(retry 2)"):
+            self.retry.add(name, job_url, count)
+
+    def counts(self) -> tuple[int, int, int, int]:
+        """Row counts as ``(crash, flaky, retry, timeout)``."""
+        return self.crash.rows, self.flaky.rows, self.retry.rows, self.timeout.rows
+
+    def close(self):
+        for table in (self.flaky, self.timeout, self.retry, self.crash):
+            table.close()
+        self._flaky_slack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 def create_success_message(
@@ -115,6 +180,7 @@ def create_success_message(
     timeout_count: int,
     flaky_content: str,
     run_id: str,
+    trend_content: str = "",
 ) -> Dict[str, Any]:
     """Create a success Slack message with flaky tests report."""
 
@@ -146,6 +212,18 @@ def create_success_message(
             }
         )
 
+    # Add history trends when a history index was used
+    if trend_content:
+        blocks.append(
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"*📉 Flakiest Over Recent Runs:*\n{trend_content}",
+                },
+            }
+        )
+
     # Add link to full report
     blocks.append(
         {
@@ -266,73 +344,76 @@ def count_failures_in_file(file_path: str) -> int:
         return 0
 
 
-def create_github_actions_summary(
+SUMMARY_SECTIONS = [
+    ("💥 Crashes", "out/crash.txt"),
+    ("⏰ Timeouts", "out/timeout.txt"),
+    ("🔄 Flaky Tests", "out/flaky.txt"),
+    ("🔁 Retry Failures", "out/retry.txt"),
+]
+
+
+def iter_github_actions_summary(
     crash_count: int,
     flaky_count: int,
     retry_count: int,
     timeout_count: int,
     run_id: str,
-) -> str:
-    """Create GitHub Actions summary content."""
-    summary_lines = []
-    
-    # Header
-    summary_lines.append(f"## 📊 Flaky Tests Report - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    summary_lines.append("")
-    
+    trends: Optional[Trends] = None,
+) -> Iterator[str]:
+    """Yield GitHub Actions summary content; report tables are copied in chunks."""
+    yield f"## 📊 Flaky Tests Report - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+
     # Summary table
-    summary_lines.append("### 📈 Failure Categories Summary")
-    summary_lines.append("")
-    summary_lines.append("| Category | Count |")
-    summary_lines.append("|----------|-------|")
-    summary_lines.append(f"| 💥 Crashes | {crash_count} |")
-    summary_lines.append(f"| ⏰ Timeouts | {timeout_count} |")
-    summary_lines.append(f"| 🔄 Flaky Tests | {flaky_count} |")
-    summary_lines.append(f"| 🔁 Retry Failures | {retry_count} |")
-    summary_lines.append("")
-    
+    yield "### 📈 Failure Categories Summary\n\n"
+    yield "| Category | Count |\n"
+    yield "|----------|-------|\n"
+    yield f"| 💥 Crashes | {crash_count} |\n"
+    yield f"| ⏰ Timeouts | {timeout_count} |\n"
+    yield f"| 🔄 Flaky Tests | {flaky_count} |\n"
+    yield f"| 🔁 Retry Failures | {retry_count} |\n\n"
+
+    if trends is not None:
+        yield from iter_trends_markdown(trends)
+
     # Add detailed tables for each category
-    if crash_count > 0 and os.path.exists("out/crash.txt"):
-        summary_lines.append("### 💥 Crashes")
-        summary_lines.append("")
-        with open("out/crash.txt", "r") as f:
-            summary_lines.append(f.read())
-        summary_lines.append("")
-    
-    if timeout_count > 0 and os.path.exists("out/timeout.txt"):
-        summary_lines.append("### ⏰ Timeouts")
-        summary_lines.append("")
-        with open("out/timeout.txt", "r") as f:
-            summary_lines.append(f.read())
-        summary_lines.append("")
-    
-    if flaky_count > 0 and os.path.exists("out/flaky.txt"):
-        summary_lines.append("### 🔄 Flaky Tests")
-        summary_lines.append("")
-        with open("out/flaky.txt", "r") as f:
-            summary_lines.append(f.read())
-        summary_lines.append("")
-    
-    if retry_count > 0 and os.path.exists("out/retry.txt"):
-        summary_lines.append("### 🔁 Retry Failures")
-        summary_lines.append("")
-        with open("out/retry.txt", "r") as f:
-            summary_lines.append(f.read())
-        summary_lines.append("")
-    
+    counts = [crash_count, timeout_count, flaky_count, retry_count]
+    for (title, path), count in zip(SUMMARY_SECTIONS, counts):
+        if count > 0 and os.path.exists(path):
+            yield f"### {title}\n\n"
+            with open(path, "r") as f:
+                while chunk := f.read(1 << 16):
+                    yield chunk
+            yield "\n\n"
+
     if crash_count == 0 and flaky_count == 0 and retry_count == 0 and timeout_count == 0:
-        summary_lines.append("🎉 **No test failures found in the last 7 days!**")
-    
-    return "\n".join(summary_lines)
+        yield "🎉 **No test failures found in the last 7 days!**"
+
+
+def create_github_actions_summary(
+    crash_count: int,
+    flaky_count: int,
+    retry_count: int,
+    timeout_count: int,
+    run_id: str,
+    trends: Optional[Trends] = None,
+) -> str:
+    """Create GitHub Actions summary content."""
+    return "".join(
+        iter_github_actions_summary(
+            crash_count, flaky_count, retry_count, timeout_count, run_id, trends
+        )
+    )
 
 
-def write_github_actions_summary(summary_content: str) -> None:
+def write_github_actions_summary(summary_content: str | Iterable[str]) -> None:
     """Write GitHub Actions summary to the step summary file."""
     try:
         summary_file = os.environ.get("GITHUB_STEP_SUMMARY")
         if summary_file:
+            if isinstance(summary_content, str):
+                summary_content = [summary_content]
             with open(summary_file, "w") as f:
-                f.write(summary_content)
+                f.writelines(summary_content)
             print(f"✅ GitHub Actions summary written to {summary_file}")
         else:
             print("⚠️ GITHUB_STEP_SUMMARY environment variable not set, skipping summary creation")
@@ -340,18 +421,17 @@ def write_github_actions_summary(summary_content: str) -> None:
         print(f"⚠️ Warning: Could not write GitHub Actions summary: {e}", file=sys.stderr)
 
 
-def process_json_file(input_filename: str):
+def process_json_file(
+    input_filename: str, history: Optional[FailureHistory] = None
+) -> tuple[int, int, int, int]:
+    """Stream the test records once into every report; returns the failure counts."""
     with open(input_filename, "r") as file:
-        # Load the file content as JSON
-        data = json.load(file)
-
-    # Create output directory if it doesn't exist
-    os.makedirs("out", exist_ok=True)
-
-    process_flaky(data, "out/flaky.txt")
-    process_tests(data, "(timeout)", "out/timeout.txt")
-    process_tests(data, "(retry 2)", "out/retry.txt")
-    process_crash(data, "(crash)", "out/crash.txt")
+        # Create output directory if it doesn't exist
+        os.makedirs("out", exist_ok=True)
+        with FlakesReport("out", history) as report:
+            for item in iter_json_array(file):
+                report.add(item)
+    return report.counts()
 
 
 def create_argument_parser() -> argparse.ArgumentParser:
@@ -379,6 +459,22 @@ def create_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument("--ref-name", help="Git branch name")
     parser.add_argument("--sha", help="Git commit SHA")
 
+    # Failure history options
+    parser.add_argument(
+        "--history-db",
+        help="SQLite file to record this run's failures in and read trends from",
+    )
+    parser.add_argument(
+        "--trend-runs",
+        type=int,
+        default=10,
+        help="Number of recent runs to compute flake rates over (default: 10)",
+    )
+    parser.add_argument(
+        "--new-since",
+        help="Report tests newly failing after this run ID (default: the previous run)",
+    )
+
     return parser
 
 
@@ -388,30 +484,43 @@ def get_failure_counts() -> tuple[int, int, int, int]:
     flaky_count = count_failures_in_file("out/flaky.txt")
     retry_count = count_failures_in_file("out/retry.txt")
     timeout_count = count_failures_in_file("out/timeout.txt")
-    
-    print(f"📊 Failure counts - Crashes: {crash_count}, Flaky: {flaky_count}, Retry: {retry_count}, Timeout: {timeout_count}")
-    
     return crash_count, flaky_count, retry_count, timeout_count
 
 
-def handle_success_case(args) -> None:
+def handle_success_case(
+    args,
+    counts: Optional[tuple[int, int, int, int]] = None,
+    trends: Optional[Trends] = None,
+) -> None:
     """Handle the successful processing case."""
-    # Count failures from generated files
-    crash_count, flaky_count, retry_count, timeout_count = get_failure_counts()
+    # Use the counts from processing, or count failures from generated files
+    if counts is None:
+        counts = get_failure_counts()
+    crash_count, flaky_count, retry_count, timeout_count = counts
+    print(f"📊 Failure counts - Crashes: {crash_count}, Flaky: {flaky_count}, Retry: {retry_count}, Timeout: {timeout_count}")
 
     # Generate GitHub Actions summary if requested
     if args.github_summary:
         print("📋 Generating GitHub Actions summary...")
-        summary_content = create_github_actions_summary(
-            crash_count, flaky_count, retry_count, timeout_count, args.run_id or "unknown"
+        summary_content = iter_github_actions_summary(
+            crash_count, flaky_count, retry_count, timeout_count, args.run_id or "unknown", trends
         )
         write_github_actions_summary(summary_content)
 
     if args.slack_webhook:
-        send_success_slack_notification(args, crash_count, flaky_count, retry_count, timeout_count)
+        send_success_slack_notification(
+            args, crash_count, flaky_count, retry_count, timeout_count, trends
+        )
 
 
-def send_success_slack_notification(args, crash_count: int, flaky_count: int, retry_count: int, timeout_count: int) -> None:
+def send_success_slack_notification(
+    args,
+    crash_count: int,
+    flaky_count: int,
+    retry_count: int,
+    timeout_count: int,
+    trends: Optional[Trends] = None,
+) -> None:
     """Send success Slack notification."""
     print("📤 Sending success Slack notification...")
     if not args.run_id:
@@ -431,6 +540,7 @@ def send_success_slack_notification(args, crash_count: int, flaky_count: int, re
         timeout_count,
         flaky_content,
         args.run_id,
+        format_trends_slack(trends) if trends is not None else "",
     )
 
     # Send the message
@@ -467,11 +577,21 @@ def main():
     parser = create_argument_parser()
     args = parser.parse_args()
 
+    history = None
     # Try to process the JSON file and handle both success and failure cases
     try:
-        process_json_file(args.file)
+        if args.history_db:
+            history = FailureHistory(args.history_db)
+            history_run_id = args.run_id or f"local-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            history.begin_run(history_run_id)
+        counts = process_json_file(args.file, history)
         print(f"Successfully processed {args.file}")
-        handle_success_case(args)
+        trends = None
+        if history is not None:
+            history.finish_run()
+            since = args.new_since or history.previous_run(history_run_id)
+            trends = history.trends(args.trend_runs, since)
+        handle_success_case(args, counts, trends)
 
     except FileNotFoundError:
         handle_failure_case(args, f"Error: File {args.file} not found")
@@ -479,6 +599,9 @@ def main():
         handle_failure_case(args, f"Error: Invalid JSON in {args.file}: {e}")
     except Exception as e:
         handle_failure_case(args, f"Error processing {args.file}: {e}")
+    finally:
+        if history is not None:
+            history.close()
 
 
 if __name__ == "__main__":
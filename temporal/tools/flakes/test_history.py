@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+from history import FailureHistory
+
+
+class FailureHistoryTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "history.db")
+        self.history = FailureHistory(self.path)
+
+    def tearDown(self):
+        self.history.close()
+
+    def record(self, run_id: str, failures: dict[str, int]):
+        self.history.begin_run(run_id)
+        for name, count in failures.items():
+            self.history.add(name, "flaky", count)
+        self.history.finish_run()
+
+    def rows(self):
+        return self.history.conn.execute(
+            "SELECT r.run_id, f.test_name, f.failure_count FROM failures f "
+            "JOIN runs r ON r.seq = f.run_seq ORDER BY r.seq, f.test_name"
+        ).fetchall()
+
+    def test_records_a_run(self):
+        self.history.begin_run("r1")
+        self.history.add("TestA", "flaky", 2)
+        # Repeated records of a test in one run add up
+        self.history.add("TestA", "flaky", 1)
+        self.history.add("TestB", "timeout", 1)
+        self.history.finish_run()
+        self.assertEqual(self.rows(), [("r1", "TestA", 3), ("r1", "TestB", 1)])
+
+    def test_unfinished_run_is_rolled_back(self):
+        self.record("r1", {"TestA": 1})
+        self.history.begin_run("r2")
+        self.history.add("TestB", "flaky", 1)
+        self.history.close()
+        self.history = FailureHistory(self.path)
+        self.assertEqual(self.rows(), [("r1", "TestA", 1)])
+
+    def test_flaky_rate_over_recent_runs(self):
+        self.record("r1", {"TestOld": 5})
+        self.record("r2", {"TestA": 1, "TestB": 1})
+        self.record("r3", {"TestA": 2})
+        self.record("r4", {"TestA": 1, "TestC": 4})
+        window, top = self.history.top_flaky(last_runs=3)
+        self.assertEqual(window, 3)
+        # TestOld fell out of the window
+        self.assertEqual(
+            [(t.name, t.failed_runs, t.failures) for t in top],
+            [("TestA", 3, 4), ("TestC", 1, 4), ("TestB", 1, 1)],
+        )
+        self.assertEqual(top[0].rate, 1.0)
+        self.assertAlmostEqual(top[1].rate, 1 / 3)
+
+    def test_newly_flaky_since_a_run(self):
+        self.record("r1", {"TestA": 1})
+        self.record("r2", {"TestB": 1})
+        self.record("r3", {"TestA": 1, "TestC": 2})
+        newly = self.history.newly_flaky("r1")
+        self.assertEqual([(t.name, t.window) for t in newly], [("TestC", 2), ("TestB", 2)])
+        self.assertEqual(self.history.previous_run("r3"), "r2")
+        self.assertEqual(self.history.newly_flaky("unknown"), [])
+
+    def test_re_recording_a_run_replaces_it(self):
+        self.record("r1", {"TestA": 1})
+        self.record("r2", {"TestA": 1, "TestB": 3})
+        self.record("r2", {"TestB": 1})
+        self.assertEqual(self.rows(), [("r1", "TestA", 1), ("r2", "TestB", 1)])
+        # The run keeps its place in the sequence
+        self.assertEqual(self.history.previous_run("r2"), "r1")
+        window, top = self.history.top_flaky(last_runs=10)
+        self.assertEqual(window, 2)
+        self.assertEqual([(t.name, t.failed_runs) for t in top], [("TestA", 1), ("TestB", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import io
+import json
+import unittest
+
+from main import iter_json_array
+
+
+def parse(text: str, chunk_size: int) -> list:
+    return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def assert_all_chunk_sizes(self, text: str):
+        expected = json.loads(text)
+        for chunk_size in range(1, len(text) + 2):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(parse(text, chunk_size), expected)
+
+    def test_numbers_split_across_chunks(self):
+        self.assert_all_chunk_sizes("[1.5, 2]")
+        self.assert_all_chunk_sizes("[1.5,2]")
+        self.assert_all_chunk_sizes("[-12e-3,400,0.25]")
+        self.assert_all_chunk_sizes("[12345678]")
+
+    def test_strings_split_across_chunks(self):
+        self.assert_all_chunk_sizes('["a,b]", "esc \\" \\\\ \\u00e9", ""]')
+
+    def test_nested_objects_split_across_chunks(self):
+        self.assert_all_chunk_sizes(
+            '[{"name": "TestA", "runs": [1, 2.5, {"ok": true}]}, {"x": null}, [], {}]'
+        )
+
+    def test_literals_and_whitespace(self):
+        self.assert_all_chunk_sizes(" [ true ,\n false , null ] ")
+
+    def test_empty_array(self):
+        self.assert_all_chunk_sizes("[]")
+        self.assert_all_chunk_sizes("  [ \n ]")
+
+    def test_malformed_input_raises(self):
+        for text in ("{}", "[1 2]", "[1,", "[1.5x]", '["open'):
+            for chunk_size in (1, 3, 64):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(json.JSONDecodeError):
+                        parse(text, chunk_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+"""In-memory index used to auto-assign new requests to the least-loaded skilled user.
+
+For every request ``type`` there is a min-heap of ``(open_count, user_id)`` over the users
+with that skill, plus one heap over all users for types nobody is skilled in. Count changes
+push a fresh entry instead of re-sorting; outdated entries are discarded lazily when they
+surface at the top, so picking an assignee and applying an update are O(log n).
+
+The index is rebuilt from Postgres when the worker starts and then maintained from the
+assignment activity and the ``request_updated`` signals the API sends to each workflow. An
+update recounts the affected users from Postgres instead of trusting the signal's idea of the
+previous assignee, which is stale when a PATCH races the auto-assignment. The index is
+per-process, and a replica only sees the updates it runs, so every replica also rebuilds it
+every ``ASSIGNMENT_REFRESH_SECONDS``.
+"""
+import asyncio
+import heapq
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from db import get_pool
+
+ANY_TYPE = "*"
+OPEN_STATUSES_SQL = "status <> 'resolved'"
+# How often each worker reloads the index from Postgres (0 disables)
+ASSIGNMENT_REFRESH_SECONDS = float(os.getenv("ASSIGNMENT_REFRESH_SECONDS", "300"))
+
+
+class AssignmentIndex:
+    def __init__(self):
+        self._open: Dict[int, int] = {}
+        self._user_types: Dict[int, Set[str]] = {}
+        self._members: Dict[str, Set[int]] = {}
+        self._heaps: Dict[str, List[Tuple[int, int]]] = {}
+        # Assignee this process last counted for each request it assigned or updated
+        self._counted: Dict[int, int] = {}
+        self.loaded = False
+
+    def load(
+        self,
+        users: Iterable[int],
+        skills: Iterable[Tuple[int, str]],
+        open_counts: Dict[int, int],
+    ):
+        """Replace the index contents; heaps are built with heapify in O(n)."""
+        self._open = {user: open_counts.get(user, 0) for user in users}
+        self._user_types = {user: {ANY_TYPE} for user in self._open}
+        self._members = {ANY_TYPE: set(self._open)}
+        for user, request_type in skills:
+            if user in self._open:
+                self._user_types[user].add(request_type)
+                self._members.setdefault(request_type, set()).add(user)
+        self._heaps = {key: self._build_heap(members) for key, members in self._members.items()}
+        self._counted = {}
+        self.loaded = True
+
+    def pick(self, request_type: str) -> Optional[int]:
+        """Least-loaded user skilled in ``request_type`` (any user if nobody is), or None."""
+        key = request_type if self._members.get(request_type) else ANY_TYPE
+        heap = self._heaps.get(key)
+        while heap:
+            count, user = heap[0]
+            if self._open.get(user) == count and key in self._user_types.get(user, ()):
+                return user
+            heapq.heappop(heap)
+        return None
+
+    def adjust(self, user: Optional[int], delta: int):
+        """Change a user's open-request count by ``delta``."""
+        if user is None or not delta:
+            return
+        if user not in self._open:
+            # Users created after the last rebuild join the general pool
+            self._open[user] = 0
+            self._user_types[user] = {ANY_TYPE}
+            self._members.setdefault(ANY_TYPE, set()).add(user)
+        count = max(self._open[user] + delta, 0)
+        self._open[user] = count
+        for key in self._user_types[user]:
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, (count, user))
+            # Keep outdated entries from piling up; rebuilding is O(members) and rare
+            if len(heap) > 4 * len(self._members[key]) + 64:
+                self._heaps[key] = self._build_heap(self._members[key])
+
+    def apply_update(
+        self,
+        old_assignee: Optional[int],
+        old_status: Optional[str],
+        new_assignee: Optional[int],
+        new_status: Optional[str],
+    ):
+        """Move open-request counts for a request whose assignee and/or status changed."""
+        was_open = old_assignee is not None and old_status != "resolved"
+        is_open = new_assignee is not None and new_status != "resolved"
+        if was_open and is_open and old_assignee == new_assignee:
+            return
+        if was_open:
+            self.adjust(old_assignee, -1)
+        if is_open:
+            self.adjust(new_assignee, 1)
+
+    def set_counts(self, counts: Dict[int, int]):
+        """Overwrite users' open-request counts with freshly counted values."""
+        for user, count in counts.items():
+            self.adjust(user, count - self._open.get(user, 0))
+
+    def track(self, request_id: int, assignee: Optional[int]):
+        """Remember who a request is counted against (None once it no longer counts)."""
+        if assignee is None:
+            self._counted.pop(request_id, None)
+        else:
+            self._counted[request_id] = assignee
+
+    def counted_assignee(self, request_id: int) -> Optional[int]:
+        return self._counted.get(request_id)
+
+    def open_count(self, user: int) -> int:
+        return self._open.get(user, 0)
+
+    def _build_heap(self, members: Iterable[int]) -> List[Tuple[int, int]]:
+        heap = [(self._open[user], user) for user in members]
+        heapq.heapify(heap)
+        return heap
+
+
+index = AssignmentIndex()
+
+
+async def rebuild_index() -> bool:
+    """Load users, skills and open-request counts from Postgres; False without a database."""
+    pool = await get_pool()
+    if pool is None:
+        return False
+    async with pool.acquire() as conn:
+        users = [r["id"] for r in await conn.fetch("SELECT id FROM users")]
+        skills = [
+            (r["user_id"], r["type"])
+            for r in await conn.fetch("SELECT user_id, type FROM user_skills")
+        ]
+        counts = await conn.fetch(
+            "SELECT assignee_id, count(*) AS n FROM requests "
+            f"WHERE assignee_id IS NOT NULL AND {OPEN_STATUSES_SQL} GROUP BY assignee_id"
+        )
+    index.load(users, skills, {r["assignee_id"]: r["n"] for r in counts})
+    print(f"Assignment index loaded: {len(users)} users, {len(skills)} skills")
+    return True
+
+
+async def assign(request_id) -> Optional[int]:
+    """Assign an unassigned request to the least-loaded skilled user and return the user id."""
+    pool = await get_pool()
+    if pool is None:
+        return None
+    if not index.loaded:
+        await rebuild_index()
+    row = await pool.fetchrow(
+        "SELECT type, assignee_id FROM requests WHERE id = $1", int(request_id)
+    )
+    if row is None:
+        return None
+    if row["assignee_id"] is not None:
+        return row["assignee_id"]
+    user = index.pick(row["type"])
+    if user is None:
+        return None
+    updated = await pool.fetchval(
+        "UPDATE requests SET assignee_id = $1, updated_at = now(), "
+        "status = CASE WHEN status = 'open' THEN 'assigned' ELSE status END "
+        "WHERE id = $2 AND assignee_id IS NULL RETURNING assignee_id",
+        user,
+        int(request_id),
+    )
+    if updated is None:
+        return None
+    index.adjust(user, 1)
+    index.track(int(request_id), user)
+    return user
+
+
+async def recount_for_request(request_id, old_assignee: Optional[int] = None) -> bool:
+    """Recount, from Postgres, every user a request's update may have moved.
+
+    Those are its current assignee, the previous one the caller knows of, and the one this
+    process last counted it against (the auto-assigned user when a PATCH raced the
+    assignment). Returns False without a database.
+    """
+    pool = await get_pool()
+    if pool is None:
+        return False
+    request_id = int(request_id)
+    row = await pool.fetchrow(
+        f"SELECT assignee_id, {OPEN_STATUSES_SQL} AS is_open FROM requests WHERE id = $1",
+        request_id,
+    )
+    current = row["assignee_id"] if row is not None and row["is_open"] else None
+    users = {old_assignee, index.counted_assignee(request_id), current} - {None}
+    if users:
+        rows = await pool.fetch(
+            "SELECT assignee_id, count(*) AS n FROM requests "
+            f"WHERE assignee_id = ANY($1::int[]) AND {OPEN_STATUSES_SQL} GROUP BY assignee_id",
+            sorted(users),
+        )
+        counts = {user: 0 for user in users}
+        counts.update({r["assignee_id"]: r["n"] for r in rows})
+        index.set_counts(counts)
+    index.track(request_id, current)
+    return True
+
+
+async def refresh_index_forever(interval: float = ASSIGNMENT_REFRESH_SECONDS):
+    """Reload the index every ``interval`` seconds so changes handled elsewhere show up."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await rebuild_index()
+        except Exception as e:
+            print("Warning: could not refresh assignment index:", e)
@@ -1,19 +1,12 @@
 from datetime import datetime
+import argparse
 import os
 import uuid
 import asyncio
 import json
 import time
 from typing import Optional
-try:
-    # prefer azure.identity when available to read Key Vault secrets via managed identity
-    from azure.identity import DefaultAzureCredential
-    from azure.keyvault.secrets import SecretClient as KVSecretClient
-    HAVE_KEYVAULT = True
-except Exception:
-    DefaultAzureCredential = None
-    KVSecretClient = None
-    HAVE_KEYVAULT = False
+from secret_provider import get_secret_provider
 
 try:
     from azure.cosmos import CosmosClient, exceptions, PartitionKey
@@ -30,11 +23,33 @@ COSMOS_DB = os.getenv("COSMOS_DB", "fastorc")
 COSMOS_CONTAINER = os.getenv("COSMOS_CONTAINER", "audit_events")
 AUDIT_RETRIES = int(os.getenv("AUDIT_RETRIES", "3"))
 AUDIT_BACKOFF_BASE = float(os.getenv("AUDIT_BACKOFF_BASE", "0.5"))
-KEYVAULT_URL = os.getenv("KEYVAULT_URL", "")
 KEYVAULT_COSMOS_SECRET = os.getenv("KEYVAULT_COSMOS_SECRET", "COSMOS_CONN")
+# Each request's events are numbered 1, 2, ... by a counter document in the request's own
+# partition; readers page by "seq greater than the last one seen" instead of from the start.
+# The counter bump and the event write commit together in one transactional batch, so a seq
+# is visible only once every lower seq of the request is.
+SEQ_COUNTER_PREFIX = "seq-"
+# Attempts to bump the counter when concurrent writers keep winning the etag race
+SEQ_CONFLICT_RETRIES = int(os.getenv("AUDIT_SEQ_CONFLICT_RETRIES", "10"))
+# Matches the single-partition timeline queries: requestId = x ORDER BY requestId, seq
+AUDIT_INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [{"path": '/"_etag"/?'}],
+    "compositeIndexes": [
+        [
+            {"path": "/requestId", "order": "ascending"},
+            {"path": "/seq", "order": "ascending"},
+        ]
+    ],
+}
+# Days Cosmos keeps an audit event before expiring it (0 keeps events forever)
+AUDIT_TTL_DAYS = int(os.getenv("AUDIT_TTL_DAYS", "0"))
 
 _client = None
 _container = None
+_watching_secret = False
 
 
 def _log_structured(level: str, action: str, payload: dict):
@@ -52,21 +67,33 @@ async def _run_blocking(fn, *args, **kwargs):
     return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
 
 
+def _apply_container_policy_blocking(db, container, partition_key):
+    """Enable TTL and add the timeline composite index on a container created before them.
+
+    create_container_if_not_exists leaves an existing container as it is: without a default TTL
+    Cosmos ignores every event's "ttl", and without the composite index the timeline queries
+    are rejected. replace_container resets whatever it is not given, so the current indexing
+    policy is passed back with only the missing composite index added.
+    """
+    properties = container.read()
+    policy = properties.get("indexingPolicy") or {}
+    composites = policy.get("compositeIndexes") or []
+    missing = [c for c in AUDIT_INDEXING_POLICY["compositeIndexes"] if c not in composites]
+    if "defaultTtl" in properties and not missing:
+        return container
+    _log_structured("info", "cosmos_container_policy_updated", {"container": properties["id"], "ttl": "defaultTtl" not in properties, "compositeIndexes": len(missing)})
+    return db.replace_container(
+        container,
+        partition_key=partition_key,
+        indexing_policy={**policy, "compositeIndexes": composites + missing},
+        default_ttl=-1,
+    )
+
+
 def _init_client_blocking():
     global _client, _container
     if _client is not None:
         return
-    # If Key Vault is configured but no env var, try to fetch from Key Vault synchronously
-    global COSMOS_CONN
-    if not COSMOS_CONN and KEYVAULT_URL and HAVE_KEYVAULT:
-        try:
-            cred = DefaultAzureCredential()
-            kv = KVSecretClient(vault_url=KEYVAULT_URL, credential=cred)
-            s = kv.get_secret(KEYVAULT_COSMOS_SECRET)
-            COSMOS_CONN = s.value
-            _log_structured('info', 'keyvault_fetch', {'secret': KEYVAULT_COSMOS_SECRET})
-        except Exception as e:
-            _log_structured('warn', 'keyvault_fetch_failed', {'error': str(e)})
     if not COSMOS_AVAILABLE or not COSMOS_CONN:
         return
     try:
@@ -74,28 +101,120 @@ def _init_client_blocking():
         db = _client.create_database_if_not_exists(id=COSMOS_DB)
         # Use PartitionKey helper if available (proper form for SDK)
         if PartitionKey is not None:
-            _container = db.create_container_if_not_exists(id=COSMOS_CONTAINER, partition_key=PartitionKey(path='/requestId'))
+            partition_key = PartitionKey(path='/requestId')
         else:
-            _container = db.create_container_if_not_exists(id=COSMOS_CONTAINER, partition_key={'path': '/requestId'})
+            partition_key = {'path': '/requestId'}
+        # default_ttl=-1 enables TTL without expiring anything by default; each event carries
+        # its own "ttl" when AUDIT_TTL_DAYS is set
+        container = db.create_container_if_not_exists(
+            id=COSMOS_CONTAINER,
+            partition_key=partition_key,
+            default_ttl=-1,
+            indexing_policy=AUDIT_INDEXING_POLICY,
+        )
+        _container = _apply_container_policy_blocking(db, container, partition_key)
     except Exception as e:
+        _close_client(_client)
         _client = None
         _container = None
         _log_structured("warn", "cosmos_init_failed", {"error": str(e)})
 
 
+def _close_client(client):
+    # Each CosmosClient owns a connection pool; dropping the reference alone leaks it
+    if client is None:
+        return
+    try:
+        client.close()
+    except Exception as e:
+        _log_structured("warn", "cosmos_close_failed", {"error": str(e)})
+
+
+def _on_cosmos_secret_rotated(value: Optional[str]):
+    # Drop the client so the next write reconnects with the rotated connection string
+    global COSMOS_CONN, _client, _container
+    COSMOS_CONN = value or ""
+    _close_client(_client)
+    _client = None
+    _container = None
+    _log_structured("info", "cosmos_secret_rotated", {"secret": KEYVAULT_COSMOS_SECRET})
+
+
+async def _resolve_cosmos_conn():
+    # Fall back to the shared secret provider (Key Vault or local) when the env var is unset
+    global COSMOS_CONN, _watching_secret
+    provider = get_secret_provider()
+    try:
+        COSMOS_CONN = await provider.get(KEYVAULT_COSMOS_SECRET) or ""
+    except Exception as e:
+        _log_structured("warn", "secret_fetch_failed", {"secret": KEYVAULT_COSMOS_SECRET, "error": str(e)})
+        return
+    if not _watching_secret:
+        provider.on_change(KEYVAULT_COSMOS_SECRET, _on_cosmos_secret_rotated)
+        _watching_secret = True
+    if COSMOS_CONN:
+        _log_structured("info", "secret_fetch", {"secret": KEYVAULT_COSMOS_SECRET})
+
+
 async def _ensure_client():
     # Run blocking init in executor once
     if _client is not None and _container is not None:
         return
-    if not COSMOS_AVAILABLE or not COSMOS_CONN:
+    if not COSMOS_AVAILABLE:
+        return
+    if not COSMOS_CONN:
+        await _resolve_cosmos_conn()
+    if not COSMOS_CONN:
         return
     await _run_blocking(_init_client_blocking)
 
 
+def _ttl_fields() -> dict:
+    return {"ttl": AUDIT_TTL_DAYS * 86400} if AUDIT_TTL_DAYS > 0 else {}
+
+
+def _batch_status(e) -> int:
+    return int(e.operation_responses[e.error_index].get("statusCode", 0))
+
+
+def _commit_with_next_seq_blocking(request_id: str, operation) -> int:
+    """Run ``operation(seq)`` and the counter bump to ``seq`` as one transactional batch.
+
+    The counter is replaced with an etag check, so a writer that lost the race to another one
+    re-reads the counter and tries the next seq. The counter carries the events' ttl and each
+    write renews it, so it expires with the request's last event. Returns the seq used.
+    """
+    counter_id = f"{SEQ_COUNTER_PREFIX}{request_id}"
+    for _ in range(SEQ_CONFLICT_RETRIES):
+        try:
+            counter = _container.read_item(counter_id, partition_key=request_id)
+            seq = counter["lastSeq"] + 1
+            counter_op = ("replace", (counter_id, {**counter, "lastSeq": seq, **_ttl_fields()}), {"if_match_etag": counter["_etag"]})
+        except exceptions.CosmosResourceNotFoundError:
+            # First event of this request; a concurrent writer may create the counter first
+            seq = 1
+            counter_op = ("create", ({"id": counter_id, "requestId": request_id, "docType": "sequence", "lastSeq": 1, **_ttl_fields()},))
+        try:
+            _container.execute_item_batch([counter_op, operation(seq)], partition_key=request_id)
+            return seq
+        except exceptions.CosmosBatchOperationError as e:
+            status = _batch_status(e)
+            if e.error_index == 0 and status in (409, 412):
+                continue
+            if e.error_index == 1 and status == 409:
+                raise exceptions.CosmosResourceExistsError(status_code=409, message=str(e))
+            raise
+    raise RuntimeError(f"Gave up allocating a seq for request {request_id} after {SEQ_CONFLICT_RETRIES} conflicts")
+
+
 async def write_audit_event(request_id: str, event_type: str, payload: dict, workflow_id: Optional[str] = None, run_id: Optional[str] = None):
     """Write an audit event document to Cosmos DB with retries and structured logging.
 
-    Returns: {"ok": True, "id": <doc_id>} or {"ok": False, "reason": ...}
+    Each event gets the request's next ``seq``, written in the same batch as the counter bump.
+    Writing an id that already exists (a retried activity, or a retry of a write that did
+    commit) is a no-op, so an event keeps the seq it was first written with.
+
+    Returns: {"ok": True, "id": <doc_id>, "seq": <seq>} or {"ok": False, "reason": ...}
     """
     await _ensure_client()
     if _container is None:
@@ -120,14 +239,22 @@ async def write_audit_event(request_id: str, event_type: str, payload: dict, wor
         "timestamp": ts,
         "payload": payload or {},
     }
+    doc.update(_ttl_fields())
 
     last_exc = None
     for attempt in range(1, AUDIT_RETRIES + 1):
         try:
-            # upsert_item is blocking; run in executor to make operation idempotent
-            await _run_blocking(_container.upsert_item, doc)
-            _log_structured("info", "audit_upsert", {"ok": True, "id": doc_id, "requestId": request_id, "eventType": event_type, "attempt": attempt})
-            return {"ok": True, "id": doc_id}
+            # The batch is blocking; run in executor
+            doc["seq"] = await _run_blocking(
+                _commit_with_next_seq_blocking,
+                doc["requestId"],
+                lambda seq: ("create", ({**doc, "seq": seq},)),
+            )
+            _log_structured("info", "audit_write", {"ok": True, "id": doc_id, "seq": doc["seq"], "requestId": request_id, "eventType": event_type, "attempt": attempt})
+            return {"ok": True, "id": doc_id, "seq": doc["seq"]}
+        except exceptions.CosmosResourceExistsError:
+            _log_structured("info", "audit_duplicate", {"id": doc_id, "requestId": request_id, "eventType": event_type})
+            return {"ok": True, "id": doc_id, "duplicate": True}
         except Exception as e:
             last_exc = e
             _log_structured("warn", "audit_write_failed", {"error": str(e), "attempt": attempt, "requestId": request_id, "eventType": event_type})
@@ -146,14 +273,75 @@ async def get_audit_events(request_id: str):
         _log_structured("info", "audit_no_cosmos_read", {"requestId": request_id})
         return []
     try:
-        query = "SELECT * FROM c WHERE c.requestId = @requestId"
+        # IS_DEFINED(c.eventType) skips the seq counter document
+        query = (
+            "SELECT * FROM c WHERE c.requestId = @requestId AND IS_DEFINED(c.eventType) "
+            "ORDER BY c.requestId ASC, c.seq ASC"
+        )
         items = list(_container.query_items(
             query=query,
-            parameters=[{"name": "@requestId", "value": request_id}],
-            enable_cross_partition_query=True
+            parameters=[{"name": "@requestId", "value": str(request_id)}],
+            partition_key=str(request_id),
         ))
         _log_structured("info", "audit_read_success", {"requestId": request_id, "count": len(items)})
         return items
     except Exception as e:
         _log_structured("error", "audit_read_failed", {"requestId": request_id, "error": str(e)})
         return []
+
+
+def backfill_seq_blocking(request_id: Optional[str] = None) -> int:
+    """Number events written before ``seq`` existed; returns how many were numbered.
+
+    Events without a seq are numbered in timestamp order after the request's current
+    ``lastSeq``, each in a batch with its counter bump, so it is safe to run while the worker is
+    writing and to rerun after an interruption. Run it before the new worker writes events
+    for old requests to keep their legacy events first in the timeline.
+    """
+    query = "SELECT c.id, c.requestId, c.timestamp FROM c WHERE IS_DEFINED(c.eventType) AND NOT IS_DEFINED(c.seq)"
+    parameters = []
+    kwargs = {"enable_cross_partition_query": True}
+    if request_id is not None:
+        query += " AND c.requestId = @requestId"
+        parameters.append({"name": "@requestId", "value": str(request_id)})
+        kwargs = {"partition_key": str(request_id)}
+    legacy = sorted(
+        _container.query_items(query=query, parameters=parameters, **kwargs),
+        key=lambda item: (item["requestId"], item.get("timestamp") or ""),
+    )
+    numbered = 0
+    for item in legacy:
+        add_seq = lambda seq, item=item: (
+            "patch",
+            (item["id"], [{"op": "add", "path": "/seq", "value": seq}]),
+            {"filter_predicate": "FROM c WHERE NOT IS_DEFINED(c.seq)"},
+        )
+        try:
+            _commit_with_next_seq_blocking(item["requestId"], add_seq)
+        except exceptions.CosmosBatchOperationError as e:
+            # Numbered by a concurrent backfill since the query ran
+            if not (e.error_index == 1 and _batch_status(e) == 412):
+                raise
+            continue
+        numbered += 1
+    _log_structured("info", "audit_seq_backfill", {"requestId": request_id, "count": numbered})
+    return numbered
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Number audit events written before seq existed")
+    parser.add_argument("command", choices=["backfill-seq"])
+    parser.add_argument("--request-id", help="Only backfill this request")
+    args = parser.parse_args(argv)
+    await _ensure_client()
+    if _container is None:
+        raise SystemExit("Cosmos DB is not configured (COSMOS_CONN)")
+    try:
+        numbered = await _run_blocking(backfill_seq_blocking, args.request_id)
+    finally:
+        await get_secret_provider().close()
+    print(f"Numbered {numbered} events")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
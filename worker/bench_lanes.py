@@ -0,0 +1,138 @@
+"""Benchmark: critical-lane latency while the low lane is saturated.
+
+Runs two scenarios against a Temporal server with a trivial workflow whose activity sleeps for
+``--work`` seconds. ``shared`` puts every workflow on one task queue with the combined slot
+budget, like the old single ``requests-hub`` queue; ``lanes`` gives low and critical work their
+own queues and slots as in ``REQUEST_LANES``. Both flood the low side with ``--low`` workflows,
+then start ``--critical`` probes at a steady rate and report their end-to-end latency.
+
+    python bench_lanes.py --address localhost:7233
+    python bench_lanes.py --local          # starts a throwaway Temporal dev server
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+from temporalio import activity, workflow
+from temporalio.client import Client
+from temporalio.worker import Worker
+
+from lanes import LaneRouter, workflow_task_slots
+
+
+@activity.defn
+async def bench_work(seconds: float) -> None:
+    await asyncio.sleep(seconds)
+
+
+@workflow.defn
+class BenchWorkflow:
+    @workflow.run
+    async def run(self, seconds: float) -> None:
+        await workflow.execute_activity(
+            bench_work, seconds, start_to_close_timeout=timedelta(minutes=10)
+        )
+
+
+async def _timed(client: Client, task_queue: str, seconds: float) -> float:
+    started = time.perf_counter()
+    await client.execute_workflow(
+        BenchWorkflow.run, seconds, id=f"bench-{uuid.uuid4()}", task_queue=task_queue
+    )
+    return time.perf_counter() - started
+
+
+async def run_scenario(
+    client: Client, queues: Dict[str, Tuple[str, int]], args
+) -> Tuple[List[float], List[float]]:
+    """``queues`` maps "low"/"critical" to ``(task_queue, slots)``; both may share one queue."""
+    async with contextlib.AsyncExitStack() as stack:
+        for task_queue, slots in set(queues.values()):
+            worker = Worker(
+                client,
+                task_queue=task_queue,
+                workflows=[BenchWorkflow],
+                activities=[bench_work],
+                max_concurrent_workflow_tasks=workflow_task_slots(slots),
+                max_concurrent_activities=slots,
+            )
+            await stack.enter_async_context(worker)
+        low = [
+            asyncio.create_task(_timed(client, queues["low"][0], args.work))
+            for _ in range(args.low)
+        ]
+        # Give the flood time to fill the low side before probing
+        await asyncio.sleep(args.warmup)
+        critical = []
+        for _ in range(args.critical):
+            critical.append(asyncio.create_task(_timed(client, queues["critical"][0], args.work)))
+            await asyncio.sleep(args.interval)
+        critical_latencies = await asyncio.gather(*critical)
+        low_latencies = await asyncio.gather(*low)
+    return critical_latencies, low_latencies
+
+
+def _summary(latencies: List[float]) -> str:
+    if len(latencies) < 2:
+        return f"n={len(latencies)}"
+    p = statistics.quantiles(latencies, n=100)
+    return (
+        f"n={len(latencies)} p50={p[49] * 1000:.0f}ms p95={p[94] * 1000:.0f}ms "
+        f"max={max(latencies) * 1000:.0f}ms"
+    )
+
+
+async def run(args):
+    env = None
+    if args.local:
+        from temporalio.testing import WorkflowEnvironment
+
+        env = await WorkflowEnvironment.start_local()
+        client = env.client
+    else:
+        client = await Client.connect(args.address, namespace=args.namespace)
+    run_id = uuid.uuid4().hex[:8]
+    shared = (f"bench-{run_id}-shared", args.low_slots + args.critical_slots)
+    scenarios = {
+        "shared": {"low": shared, "critical": shared},
+        "lanes": {
+            "low": (f"bench-{run_id}-low", args.low_slots),
+            "critical": (f"bench-{run_id}-critical", args.critical_slots),
+        },
+    }
+    try:
+        for name, queues in scenarios.items():
+            started = time.perf_counter()
+            critical, low = await run_scenario(client, queues, args)
+            elapsed = time.perf_counter() - started
+            print(f"[{name}] critical: {_summary(critical)}")
+            print(f"[{name}] low:      {_summary(low)} ({len(low) / elapsed:.1f} wf/s)")
+    finally:
+        if env is not None:
+            await env.shutdown()
+
+
+def main():
+    router = LaneRouter()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--address", default=os.getenv("TEMPORAL_ADDRESS", "localhost:7233"))
+    parser.add_argument("--namespace", default=os.getenv("TEMPORAL_NAMESPACE", "default"))
+    parser.add_argument("--local", action="store_true", help="Start a local dev server")
+    parser.add_argument("--low", type=int, default=400, help="Low-priority workflows to flood")
+    parser.add_argument("--critical", type=int, default=40, help="Critical probes to time")
+    parser.add_argument("--work", type=float, default=0.5, help="Activity duration (seconds)")
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between probes")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--low-slots", type=int, default=router.lane_for("low").slots)
+    parser.add_argument("--critical-slots", type=int, default=router.lane_for("high").slots)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
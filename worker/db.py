@@ -0,0 +1,183 @@
+"""Shared asyncpg pool for worker activities that touch the primary Postgres database.
+
+Request rows are read through ``request_loader``, which batches concurrent lookups the way a
+DataLoader does. Every id asked for within ``REQUEST_LOOKUP_WINDOW_MS`` (or until
+``REQUEST_LOOKUP_MAX_BATCH`` ids are queued) is fetched by a single ``WHERE id = ANY($1)``
+query. Results, including "not found", are cached for ``REQUEST_LOOKUP_TTL`` seconds. A burst
+of SLA timers firing together then costs a handful of queries, not one per workflow.
+"""
+import asyncio
+import os
+import ssl
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import asyncpg
+    HAVE_ASYNCPG = True
+except Exception:
+    asyncpg = None
+    HAVE_ASYNCPG = False
+
+# Same URL the API uses; asyncpg wants the plain postgresql:// scheme
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_SSL = os.getenv("DB_SSL", "require")
+REQUEST_LOOKUP_TTL = float(os.getenv("REQUEST_LOOKUP_TTL", "2"))
+REQUEST_LOOKUP_WINDOW_MS = float(os.getenv("REQUEST_LOOKUP_WINDOW_MS", "2"))
+REQUEST_LOOKUP_MAX_BATCH = int(os.getenv("REQUEST_LOOKUP_MAX_BATCH", "1000"))
+
+_pool = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+def _dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+async def get_pool():
+    """Return the process-wide pool, creating it on first use; None when no database is configured."""
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if not DATABASE_URL or not HAVE_ASYNCPG:
+        return None
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            ssl_arg = ssl.create_default_context() if DB_SSL == "require" else None
+            _pool = await asyncpg.create_pool(
+                _dsn(DATABASE_URL),
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                ssl=ssl_arg,
+            )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def record_escalation(request_id) -> bool:
+    """Mark a request as escalated once; a trigger bumps the ``escalated`` stats counter.
+
+    Returns True when this call recorded the escalation, False if it was already recorded or
+    no database is configured.
+    """
+    pool = await get_pool()
+    if pool is None:
+        return False
+    status = await pool.execute(
+        "INSERT INTO request_escalations (request_id) VALUES ($1) ON CONFLICT DO NOTHING",
+        int(request_id),
+    )
+    return status.endswith(" 1")
+
+
+class RequestLoader:
+    """Batches and briefly caches lookups by id.
+
+    ``fetch`` takes a list of ids and returns ``{id: row}`` for those that exist. Concurrent
+    ``load`` calls for the same id share one pending result.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[int]], Awaitable[Dict[int, Any]]],
+        ttl: float = REQUEST_LOOKUP_TTL,
+        window_ms: float = REQUEST_LOOKUP_WINDOW_MS,
+        max_batch: int = REQUEST_LOOKUP_MAX_BATCH,
+    ):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._cache: Dict[int, Tuple[float, Any]] = {}
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._queued: List[int] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks; hold batches until they finish
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, key: int) -> Any:
+        """The row for ``key``, or None when it does not exist."""
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        future = self._waiting.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._waiting[key] = loop.create_future()
+            self._queued.append(key)
+            if len(self._queued) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+        # Shielded so one cancelled caller doesn't cancel the result for the others
+        return await asyncio.shield(future)
+
+    def clear(self, key: Optional[int] = None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queued = self._queued, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[int]):
+        try:
+            rows = await self._fetch(batch)
+        except Exception as e:
+            for key in batch:
+                future = self._waiting.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        now = time.monotonic()
+        self._prune(now)
+        expires = now + self.ttl
+        for key in batch:
+            row = rows.get(key)
+            self._cache[key] = (expires, row)
+            future = self._waiting.pop(key)
+            if not future.done():
+                future.set_result(row)
+
+    def _prune(self, now: float):
+        # Expired entries are only dropped here, so the cache never outgrows a few batches
+        if len(self._cache) > self.max_batch * 4:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+
+
+async def _fetch_requests(ids: List[int]) -> Dict[int, dict]:
+    pool = await get_pool()
+    if pool is None:
+        return {}
+    rows = await pool.fetch(
+        "SELECT id, status::text AS status, type, priority, assignee_id "
+        "FROM requests WHERE id = ANY($1::int[])",
+        ids,
+    )
+    return {row["id"]: dict(row) for row in rows}
+
+
+request_loader = RequestLoader(_fetch_requests)
+
+
+async def load_request(request_id) -> Optional[dict]:
+    """Status, type, priority and assignee of a request (None when it does not exist)."""
+    return await request_loader.load(int(request_id))
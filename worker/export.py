@@ -0,0 +1,206 @@
+"""Bulk export of audit events for a time window as gzip-compressed NDJSON.
+
+Each physical partition (Cosmos feed range) is read by its own producer; a semaphore bounds
+how many run at once, and with the page size that bounds the RU rate. Pages flow through a
+small bounded queue to a single writer, so memory stays flat regardless of the export size.
+
+Every page is written as its own gzip member (concatenated members form a valid gzip stream)
+and the checkpoint is saved after each one with the byte offset and per-range continuation
+tokens. A resumed export truncates any partial member past the offset and carries on.
+
+Usage:
+    python export.py --start 2025-10-01 --end 2025-11-01 --out audit.ndjson.gz
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from audit import COSMOS_CONTAINER, COSMOS_DB, KEYVAULT_COSMOS_SECRET, _log_structured
+from secret_provider import get_secret_provider
+
+try:
+    from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+except Exception:
+    AsyncCosmosClient = None
+
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+_EXPORT_QUERY = "SELECT * FROM c WHERE c.timestamp >= @start AND c.timestamp < @end"
+
+
+def format_bound(value: datetime) -> str:
+    """Format a window bound the way write_audit_event formats ``timestamp``."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _range_key(feed_range: Dict[str, Any]) -> str:
+    return json.dumps(feed_range, sort_keys=True)
+
+
+def _load_checkpoint(path: Optional[str], start: str, end: str) -> Dict[str, Any]:
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("start") == start and checkpoint.get("end") == end:
+            return checkpoint
+        raise ValueError(f"Checkpoint {path} belongs to a different time window")
+    return {"start": start, "end": end, "offset": 0, "ranges": {}, "events": 0}
+
+
+def _save_checkpoint(path: Optional[str], checkpoint: Dict[str, Any]):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def _append_member(out, items) -> int:
+    payload = "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in items)
+    out.write(gzip.compress(payload.encode("utf-8")))
+    out.flush()
+    os.fsync(out.fileno())
+    return out.tell()
+
+
+async def export_audit_events(
+    container,
+    start: datetime,
+    end: datetime,
+    out_path: str,
+    checkpoint_path: Optional[str] = None,
+    concurrency: int = EXPORT_CONCURRENCY,
+    page_size: int = EXPORT_PAGE_SIZE,
+) -> Dict[str, Any]:
+    """Stream every audit event with ``start <= timestamp < end`` into ``out_path``.
+
+    Returns the final checkpoint dict (``events`` holds the running total exported).
+    """
+    start_s, end_s = format_bound(start), format_bound(end)
+    checkpoint = _load_checkpoint(checkpoint_path, start_s, end_s)
+    ranges = checkpoint["ranges"]
+    feed_ranges = [fr async for fr in container.read_feed_ranges()]
+    for fr in feed_ranges:
+        ranges.setdefault(_range_key(fr), {"token": None, "done": False})
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(concurrency, 1) * 2)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    parameters = [{"name": "@start", "value": start_s}, {"name": "@end", "value": end_s}]
+
+    async def produce(feed_range):
+        key = _range_key(feed_range)
+        state = ranges[key]
+        if state["done"]:
+            return
+        async with semaphore:
+            try:
+                pages = container.query_items(
+                    query=_EXPORT_QUERY,
+                    parameters=parameters,
+                    feed_range=feed_range,
+                    max_item_count=page_size,
+                ).by_page(continuation_token=state["token"])
+                finished = False
+                async for page in pages:
+                    items = [item async for item in page]
+                    token = pages.continuation_token
+                    # A page without a continuation token is the last one for this range
+                    await queue.put((key, items, token))
+                    finished = token is None
+            except Exception as e:
+                # Hand the error to the writer; the checkpoint keeps the last good token
+                await queue.put((key, e, None))
+                return
+            if not finished:
+                await queue.put((key, [], None))
+
+    mode = "r+b" if os.path.exists(out_path) and checkpoint["offset"] else "wb"
+    with open(out_path, mode) as out:
+        # Drop anything written after the last checkpoint (e.g. a half-written member)
+        out.seek(checkpoint["offset"])
+        out.truncate()
+
+        producers = asyncio.gather(*(produce(fr) for fr in feed_ranges))
+        pending = sum(1 for fr in feed_ranges if not ranges[_range_key(fr)]["done"])
+        try:
+            while pending:
+                key, items, token = await queue.get()
+                if isinstance(items, Exception):
+                    raise items
+                if items:
+                    checkpoint["offset"] = await asyncio.to_thread(_append_member, out, items)
+                    checkpoint["events"] += len(items)
+                if token is None:
+                    ranges[key] = {"token": None, "done": True}
+                    pending -= 1
+                else:
+                    ranges[key]["token"] = token
+                await asyncio.to_thread(_save_checkpoint, checkpoint_path, checkpoint)
+            await producers
+        finally:
+            if not producers.done():
+                producers.cancel()
+                await asyncio.gather(producers, return_exceptions=True)
+
+    _log_structured(
+        "info",
+        "audit_export_complete",
+        {"out": out_path, "events": checkpoint["events"], "start": start_s, "end": end_s},
+    )
+    return checkpoint
+
+
+async def _open_container():
+    conn = os.getenv("COSMOS_CONN") or await get_secret_provider().get(KEYVAULT_COSMOS_SECRET)
+    if not conn or AsyncCosmosClient is None:
+        raise SystemExit("Cosmos DB is not configured (COSMOS_CONN / Key Vault)")
+    client = AsyncCosmosClient.from_connection_string(conn)
+    container = client.get_database_client(COSMOS_DB).get_container_client(COSMOS_CONTAINER)
+    return client, container
+
+
+def create_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Export audit events as gzip-compressed NDJSON")
+    parser.add_argument(
+        "--start", required=True, type=datetime.fromisoformat, help="Inclusive ISO start"
+    )
+    parser.add_argument(
+        "--end", required=True, type=datetime.fromisoformat, help="Exclusive ISO end"
+    )
+    parser.add_argument("--out", required=True, help="Output .ndjson.gz path")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <out>.checkpoint.json)")
+    parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY)
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    return parser
+
+
+async def main(argv=None):
+    args = create_argument_parser().parse_args(argv)
+    checkpoint_path = args.checkpoint or args.out + ".checkpoint.json"
+    client, container = await _open_container()
+    try:
+        result = await export_audit_events(
+            container,
+            args.start,
+            args.end,
+            args.out,
+            checkpoint_path=checkpoint_path,
+            concurrency=args.concurrency,
+            page_size=args.page_size,
+        )
+    finally:
+        await client.close()
+        await get_secret_provider().close()
+    print(f"Exported {result['events']} events to {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""Temporal search attributes kept on every ``RequestWorkflow``.
+
+The API sets ``RequestPriority`` and ``RequestType`` (plus ``RequestStatus=open``) when it
+starts a workflow; the workflow upserts ``RequestStatus``, ``SlaDeadline`` and ``Escalated`` as
+its state changes. Operational questions such as "open, high priority and past SLA" are then
+answered from Temporal visibility without touching Postgres::
+
+    WorkflowType = 'RequestWorkflow' AND RequestStatus = 'open'
+        AND RequestPriority = 'high' AND SlaDeadline < '2025-11-01T00:00:00Z'
+
+Custom attributes must be registered in the namespace before workflows can use them; the worker
+registers them on startup (``ensure_search_attributes``), and so does the API since it may start
+first; or run once per namespace::
+
+    temporal operator search-attribute create --namespace <ns> \\
+        --name RequestStatus --type Keyword --name RequestPriority --type Keyword \\
+        --name RequestType --type Keyword --name SlaDeadline --type Datetime \\
+        --name Escalated --type Bool
+"""
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+from temporalio.common import SearchAttributeKey
+
+WORKFLOW_TYPE = "RequestWorkflow"
+
+STATUS = SearchAttributeKey.for_keyword("RequestStatus")
+PRIORITY = SearchAttributeKey.for_keyword("RequestPriority")
+TYPE = SearchAttributeKey.for_keyword("RequestType")
+SLA_DEADLINE = SearchAttributeKey.for_datetime("SlaDeadline")
+ESCALATED = SearchAttributeKey.for_bool("Escalated")
+
+ALL_KEYS = (STATUS, PRIORITY, TYPE, SLA_DEADLINE, ESCALATED)
+
+
+async def ensure_search_attributes(client, namespace: str) -> List[str]:
+    """Register any of ``ALL_KEYS`` missing from ``namespace``; returns the names added."""
+    from temporalio.api.operatorservice.v1 import (
+        AddSearchAttributesRequest,
+        ListSearchAttributesRequest,
+    )
+
+    existing = await client.operator_service.list_search_attributes(
+        ListSearchAttributesRequest(namespace=namespace)
+    )
+    known = set(existing.custom_attributes) | set(existing.system_attributes)
+    missing = {
+        key.name: int(key.indexed_value_type) for key in ALL_KEYS if key.name not in known
+    }
+    if missing:
+        await client.operator_service.add_search_attributes(
+            AddSearchAttributesRequest(namespace=namespace, search_attributes=missing)
+        )
+    return sorted(missing)
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _keyword_clause(name: str, values: Optional[Iterable[str]]) -> Optional[str]:
+    values = [v for v in values or () if v]
+    if not values:
+        return None
+    if len(values) == 1:
+        return f"{name} = {_quote(values[0])}"
+    return f"{name} IN ({', '.join(_quote(v) for v in values)})"
+
+
+def build_visibility_query(
+    status: Optional[Iterable[str]] = None,
+    priority: Optional[Iterable[str]] = None,
+    type: Optional[Iterable[str]] = None,
+    escalated: Optional[bool] = None,
+    sla_before: Optional[datetime] = None,
+    running_only: bool = True,
+) -> str:
+    """A visibility list filter for request workflows matching every given condition."""
+    clauses = [f"WorkflowType = {_quote(WORKFLOW_TYPE)}"]
+    if running_only:
+        clauses.append("ExecutionStatus = 'Running'")
+    for key, values in ((STATUS, status), (PRIORITY, priority), (TYPE, type)):
+        clause = _keyword_clause(key.name, values)
+        if clause:
+            clauses.append(clause)
+    if escalated is not None:
+        clauses.append(f"{ESCALATED.name} = {'true' if escalated else 'false'}")
+    if sla_before is not None:
+        if sla_before.tzinfo is None:
+            sla_before = sla_before.replace(tzinfo=timezone.utc)
+        stamp = sla_before.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        clauses.append(f"{SLA_DEADLINE.name} < {_quote(stamp)}")
+    return " AND ".join(clauses)
@@ -0,0 +1,110 @@
+import pytest
+
+import assignment
+from assignment import AssignmentIndex
+
+
+def _index():
+    index = AssignmentIndex()
+    index.load(
+        users=[1, 2, 3],
+        skills=[(1, "bug"), (2, "bug"), (3, "access")],
+        open_counts={1: 4, 2: 1, 3: 0},
+    )
+    return index
+
+
+def test_pick_prefers_least_loaded_skilled_user():
+    index = _index()
+    assert index.pick("bug") == 2
+    assert index.pick("access") == 3
+
+
+def test_pick_falls_back_to_all_users_for_unknown_type():
+    assert _index().pick("data_export") == 3
+
+
+def test_adjust_reorders_heap():
+    index = _index()
+    index.adjust(2, 4)
+    assert index.pick("bug") == 1
+    index.adjust(1, -3)
+    assert index.pick("bug") == 1
+    assert index.open_count(1) == 1
+
+
+def test_apply_update_moves_counts():
+    index = _index()
+    # Reassigned from 2 to 1
+    index.apply_update(2, "assigned", 1, "in_progress")
+    assert index.open_count(2) == 0
+    assert index.open_count(1) == 5
+    # Resolved requests no longer count
+    index.apply_update(1, "in_progress", 1, "resolved")
+    assert index.open_count(1) == 4
+    # Status change on the same assignee is a no-op
+    index.apply_update(3, "open", 3, "in_progress")
+    assert index.open_count(3) == 0
+
+
+def test_unknown_user_joins_general_pool():
+    index = _index()
+    index.adjust(9, 1)
+    index.adjust(3, 5)
+    index.adjust(2, 5)
+    assert index.pick("data_export") == 9
+    assert index.pick("access") == 3
+
+
+def test_many_adjustments_keep_heap_bounded():
+    index = _index()
+    for _ in range(1000):
+        index.adjust(1, 1)
+        index.adjust(1, -1)
+    assert len(index._heaps["bug"]) < 100
+    assert index.pick("bug") == 2
+
+
+class FakePool:
+    """Answers the two recount queries from an in-memory ``requests`` table."""
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    async def fetchrow(self, query, request_id):
+        row = self.requests.get(request_id)
+        if row is None:
+            return None
+        return {"assignee_id": row["assignee_id"], "is_open": row["status"] != "resolved"}
+
+    async def fetch(self, query, users):
+        counts = {}
+        for row in self.requests.values():
+            if row["assignee_id"] in users and row["status"] != "resolved":
+                counts[row["assignee_id"]] = counts.get(row["assignee_id"], 0) + 1
+        return [{"assignee_id": user, "n": n} for user, n in counts.items()]
+
+
+@pytest.mark.asyncio
+async def test_recount_reverses_auto_assignment_overtaken_by_patch(monkeypatch):
+    requests = {10: {"assignee_id": None, "status": "open"}}
+    pool = FakePool(requests)
+
+    async def get_pool():
+        return pool
+
+    index = _index()
+    monkeypatch.setattr(assignment, "get_pool", get_pool)
+    monkeypatch.setattr(assignment, "index", index)
+    # Auto-assigned to user 2 ...
+    requests[10] = {"assignee_id": 2, "status": "assigned"}
+    index.adjust(2, 1)
+    index.track(10, 2)
+    # ... then reassigned by a PATCH whose signal still thought nobody was assigned
+    requests[10] = {"assignee_id": 3, "status": "assigned"}
+    assert await assignment.recount_for_request(10, old_assignee=None)
+    assert (index.open_count(2), index.open_count(3)) == (0, 1)
+    requests[10]["status"] = "resolved"
+    await assignment.recount_for_request(10, old_assignee=3)
+    assert index.open_count(3) == 0
+    assert index.counted_assignee(10) is None
@@ -0,0 +1,180 @@
+import pytest
+from azure.cosmos import exceptions
+
+import audit
+
+
+class FakeContainer:
+    """Single-process stand-in for the container: etags, patches and atomic batches."""
+
+    def __init__(self):
+        self.docs = {}
+        self.before_batch = None
+        self._etags = 0
+
+    def _store(self, body):
+        self._etags += 1
+        self.docs[body["id"]] = {**body, "_etag": str(self._etags)}
+
+    def read_item(self, item, partition_key):
+        doc = self.docs.get(item)
+        if doc is None or doc["requestId"] != partition_key:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="Not found")
+        return dict(doc)
+
+    def query_items(self, query, parameters=None, partition_key=None, enable_cross_partition_query=None):
+        assert "NOT IS_DEFINED(c.seq)" in query
+        return [
+            dict(d) for d in self.docs.values()
+            if "eventType" in d and "seq" not in d and partition_key in (None, d["requestId"])
+        ]
+
+    def _apply(self, op):
+        kind, args = op[0], op[1]
+        kwargs = op[2] if len(op) > 2 else {}
+        if kind == "create":
+            if args[0]["id"] in self.docs:
+                return 409
+            self._store(args[0])
+            return 201
+        doc = self.docs.get(args[0])
+        if doc is None:
+            return 404
+        if kind == "replace":
+            if kwargs.get("if_match_etag") not in (None, doc["_etag"]):
+                return 412
+            self._store(args[1])
+            return 200
+        assert kind == "patch"
+        if kwargs.get("filter_predicate") and "seq" in doc:
+            return 412
+        for patch in args[1]:
+            doc[patch["path"].lstrip("/")] = patch["value"]
+        return 200
+
+    def execute_item_batch(self, batch_operations, partition_key):
+        if self.before_batch is not None:
+            hook, self.before_batch = self.before_batch, None
+            hook()
+        saved = {k: dict(v) for k, v in self.docs.items()}
+        for index, op in enumerate(batch_operations):
+            status = self._apply(op)
+            if status >= 400:
+                self.docs = saved
+                responses = [{"statusCode": 424}] * len(batch_operations)
+                responses[index] = {"statusCode": status}
+                raise exceptions.CosmosBatchOperationError(
+                    error_index=index, headers={}, status_code=status,
+                    message="Batch failed", operation_responses=responses,
+                )
+        return [{"statusCode": 200}] * len(batch_operations)
+
+
+@pytest.fixture
+def container(monkeypatch):
+    fake = FakeContainer()
+    monkeypatch.setattr(audit, "_client", object())
+    monkeypatch.setattr(audit, "_container", fake)
+    monkeypatch.setattr(audit, "AUDIT_TTL_DAYS", 0)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_events_get_per_request_sequence_numbers(container):
+    first = await audit.write_audit_event("7", "created", {}, run_id="r1")
+    second = await audit.write_audit_event("7", "escalated", {}, run_id="r1")
+    other = await audit.write_audit_event("8", "created", {}, run_id="r2")
+    assert (first["seq"], second["seq"], other["seq"]) == (1, 2, 1)
+    assert container.docs["r1-escalated"]["seq"] == 2
+    assert container.docs["seq-7"]["lastSeq"] == 2
+
+
+@pytest.mark.asyncio
+async def test_rewriting_an_event_keeps_its_sequence_number(container):
+    await audit.write_audit_event("7", "created", {}, run_id="r1")
+    again = await audit.write_audit_event("7", "created", {}, run_id="r1")
+    assert again == {"ok": True, "id": "r1-created", "duplicate": True}
+    assert container.docs["r1-created"]["seq"] == 1
+
+
+@pytest.mark.asyncio
+async def test_writer_that_loses_the_counter_race_takes_the_next_seq(container):
+    await audit.write_audit_event("7", "created", {}, run_id="r1")
+    # Another writer commits seq 2 between this writer's counter read and its batch
+    container.before_batch = lambda: audit._commit_with_next_seq_blocking(
+        "7", lambda seq: ("create", ({"id": "other", "requestId": "7", "eventType": "note", "seq": seq},))
+    )
+    mine = await audit.write_audit_event("7", "escalated", {}, run_id="r1")
+    assert (container.docs["other"]["seq"], mine["seq"]) == (2, 3)
+    assert container.docs["seq-7"]["lastSeq"] == 3
+
+
+@pytest.mark.asyncio
+async def test_counter_expires_with_the_events(container, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_TTL_DAYS", 30)
+    await audit.write_audit_event("7", "created", {}, run_id="r1")
+    await audit.write_audit_event("7", "escalated", {}, run_id="r1")
+    assert container.docs["seq-7"]["ttl"] == container.docs["r1-escalated"]["ttl"] == 30 * 86400
+
+
+def test_backfill_numbers_legacy_events_in_timestamp_order(container):
+    for doc_id, ts in (("late", "2025-01-02T00:00:00Z"), ("early", "2025-01-01T00:00:00Z")):
+        container.docs[doc_id] = {"id": doc_id, "requestId": "7", "eventType": "note", "timestamp": ts}
+    container.docs["other"] = {"id": "other", "requestId": "8", "eventType": "note", "timestamp": "2025-01-01T00:00:00Z"}
+    assert audit.backfill_seq_blocking("7") == 2
+    assert (container.docs["early"]["seq"], container.docs["late"]["seq"]) == (1, 2)
+    assert "seq" not in container.docs["other"]
+    assert audit.backfill_seq_blocking() == 1
+    assert audit.backfill_seq_blocking() == 0
+    assert container.docs["seq-7"]["lastSeq"] == 2
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.replaced = []
+
+    def replace_container(self, container, partition_key, indexing_policy, default_ttl):
+        self.replaced.append({"indexingPolicy": indexing_policy, "defaultTtl": default_ttl})
+        return container
+
+
+class FakeContainerProperties:
+    def __init__(self, properties):
+        self.properties = properties
+
+    def read(self):
+        return dict(self.properties)
+
+
+def test_existing_container_gets_ttl_and_composite_index():
+    policy = {"indexingMode": "consistent", "includedPaths": [{"path": "/*"}]}
+    old = FakeContainerProperties({"id": "audit_events", "indexingPolicy": policy})
+    db = FakeDatabase()
+    assert audit._apply_container_policy_blocking(db, old, "/requestId") is old
+    assert db.replaced == [{
+        "indexingPolicy": {**policy, "compositeIndexes": audit.AUDIT_INDEXING_POLICY["compositeIndexes"]},
+        "defaultTtl": -1,
+    }]
+    # Already up to date: left alone
+    current = FakeContainerProperties(
+        {"id": "audit_events", "defaultTtl": -1, "indexingPolicy": audit.AUDIT_INDEXING_POLICY}
+    )
+    db = FakeDatabase()
+    audit._apply_container_policy_blocking(db, current, "/requestId")
+    assert db.replaced == []
+
+
+def test_rotation_closes_the_old_client(monkeypatch):
+    class FakeClient:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    old = FakeClient()
+    monkeypatch.setattr(audit, "_client", old)
+    monkeypatch.setattr(audit, "_container", object())
+    monkeypatch.setattr(audit, "COSMOS_CONN", "old")
+    audit._on_cosmos_secret_rotated("new")
+    assert old.closed
+    assert (audit._client, audit._container, audit.COSMOS_CONN) == (None, None, "new")
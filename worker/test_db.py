@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from db import RequestLoader
+
+
+class FakeFetch:
+    def __init__(self, rows, fail=False):
+        self.rows = rows
+        self.fail = fail
+        self.calls = []
+
+    async def __call__(self, ids):
+        self.calls.append(sorted(ids))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        return {i: self.rows[i] for i in ids if i in self.rows}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_share_one_query():
+    fetch = FakeFetch({i: {"id": i, "status": "open"} for i in range(100)})
+    loader = RequestLoader(fetch, ttl=60, window_ms=1)
+    rows = await asyncio.gather(*(loader.load(i % 100) for i in range(1000)), loader.load(500))
+    assert fetch.calls == [list(range(100)) + [500]]
+    assert rows[7] == {"id": 7, "status": "open"}
+    assert rows[-1] is None
+    # Served from the cache, including "not found"
+    assert await loader.load(7) == {"id": 7, "status": "open"}
+    assert await loader.load(500) is None
+    assert len(fetch.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_batches_are_capped_and_cache_expires():
+    fetch = FakeFetch({i: {"id": i} for i in range(10)})
+    loader = RequestLoader(fetch, ttl=0, window_ms=1, max_batch=4)
+    await asyncio.gather(*(loader.load(i) for i in range(10)))
+    assert fetch.calls == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    await loader.load(0)
+    assert fetch.calls[-1] == [0]
+
+
+@pytest.mark.asyncio
+async def test_fetch_errors_reach_every_waiter():
+    loader = RequestLoader(FakeFetch({}, fail=True), window_ms=1)
+    results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_in_flight_batches_are_referenced_until_done():
+    release = asyncio.Event()
+
+    async def fetch(ids):
+        await release.wait()
+        return {i: {"id": i} for i in ids}
+
+    loader = RequestLoader(fetch, window_ms=0)
+    pending = asyncio.ensure_future(loader.load(1))
+    await asyncio.sleep(0.01)
+    assert len(loader._tasks) == 1
+    release.set()
+    assert await pending == {"id": 1}
+    await asyncio.sleep(0)
+    assert not loader._tasks
@@ -0,0 +1,32 @@
+import pytest
+from lanes import LaneRouter, parse_lanes, workflow_task_slots
+
+
+def test_routes_priorities_to_lane_queues():
+    router = LaneRouter(parse_lanes("critical=high|urgent:16,default=*:32,low=low:8", "hub"))
+    assert router.task_queue_for("high") == "hub-critical"
+    assert router.task_queue_for("URGENT") == "hub-critical"
+    assert router.task_queue_for("low") == "hub-low"
+    # Unlisted priorities use the catch-all lane on the base queue
+    assert router.task_queue_for("medium") == "hub"
+    assert router.task_queue_for(None) == "hub"
+    assert router.lane_for("low").slots == 8
+
+
+def test_select_lanes():
+    router = LaneRouter(parse_lanes("critical=high:16,default=*:32", "hub"))
+    assert [lane.name for lane in router.select([""])] == ["critical", "default"]
+    assert [lane.name for lane in router.select(["critical"])] == ["critical"]
+    with pytest.raises(ValueError):
+        router.select(["bogus"])
+
+
+def test_invalid_lane_specs():
+    with pytest.raises(ValueError):
+        parse_lanes("critical=high:16", "hub")
+    with pytest.raises(ValueError):
+        parse_lanes("a=high:1,b=high|*:2", "hub")
+
+
+def test_workflow_task_slots_keeps_temporal_minimum():
+    assert [workflow_task_slots(n) for n in (1, 2, 8)] == [2, 2, 8]
@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+from search_attributes import build_visibility_query
+
+
+def test_visibility_query_combines_filters():
+    query = build_visibility_query(
+        status=["open"],
+        priority=["high", "critical"],
+        escalated=False,
+        sla_before=datetime(2025, 11, 1, 12, 30, tzinfo=timezone.utc),
+    )
+    assert query == (
+        "WorkflowType = 'RequestWorkflow' AND ExecutionStatus = 'Running'"
+        " AND RequestStatus = 'open' AND RequestPriority IN ('high', 'critical')"
+        " AND Escalated = false AND SlaDeadline < '2025-11-01T12:30:00Z'"
+    )
+
+
+def test_visibility_query_quotes_values():
+    query = build_visibility_query(type=["it's"], running_only=False)
+    assert query == "WorkflowType = 'RequestWorkflow' AND RequestType = 'it\\'s'"
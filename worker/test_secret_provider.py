@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+
+import pytest
+from secret_provider import LocalBackend, SecretProvider
+
+
+class CountingBackend:
+    def __init__(self, value="v1", delay=0.0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    async def fetch(self, name):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.value
+
+    async def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_local_backend_env_then_file(tmp_path, monkeypatch):
+    path = tmp_path / "secrets.json"
+    path.write_text(json.dumps({"COSMOS_CONN": "from-file"}))
+    backend = LocalBackend(str(path))
+    monkeypatch.delenv("COSMOS_CONN", raising=False)
+    assert await backend.fetch("COSMOS_CONN") == "from-file"
+    assert await backend.fetch("MISSING") is None
+    monkeypatch.setenv("COSMOS_CONN", "from-env")
+    assert await backend.fetch("COSMOS_CONN") == "from-env"
+
+
+@pytest.mark.asyncio
+async def test_local_backend_directory(tmp_path):
+    (tmp_path / "COSMOS_CONN").write_text("from-dir\n")
+    assert await LocalBackend(str(tmp_path)).fetch("COSMOS_CONN") == "from-dir"
+
+
+@pytest.mark.asyncio
+async def test_cache_and_single_flight():
+    backend = CountingBackend(delay=0.01)
+    provider = SecretProvider(backend, ttl=60)
+    values = await asyncio.gather(*(provider.get("s") for _ in range(10)))
+    assert values == ["v1"] * 10
+    assert await provider.get("s") == "v1"
+    assert backend.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_background_refresh_notifies_on_rotation():
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=1.2, refresh_margin=0.6)
+    seen = []
+    provider.on_change("s", seen.append)
+    assert await provider.get("s") == "v1"
+    backend.value = "v2"
+    provider.start()
+    try:
+        await asyncio.sleep(1.5)
+    finally:
+        await provider.close()
+    assert seen == ["v2"]
+    assert await provider.get("s") == "v2"
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_serves_stale_value():
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=0.01)
+    assert await provider.get("s") == "v1"
+    await asyncio.sleep(0.02)
+
+    async def boom(name):
+        raise RuntimeError("vault down")
+
+    backend.fetch = boom
+    assert await provider.get("s") == "v1"
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_waits_for_retry_delay():
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=300, refresh_margin=60, retry_after=15)
+    assert await provider.get("s") == "v1"
+    now = time.monotonic()
+    assert provider._next_refresh_delay(now) == pytest.approx(240, abs=1)
+
+    async def boom(name):
+        raise RuntimeError("vault down")
+
+    backend.fetch = boom
+    provider._cache["s"] = ("v1", now - 1)
+    assert await provider._load("s") == "v1"
+    # Retried after retry_after, not every second inside the refresh margin
+    assert provider._next_refresh_delay(time.monotonic()) == pytest.approx(15, abs=1)
@@ -1,6 +1,9 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
 import pytest
 from workflows import validate_request, notify, escalate, check_status
-import asyncio
 
 @pytest.mark.asyncio
 async def test_validate_request():
@@ -17,3 +20,119 @@ async def test_escalate():
 @pytest.mark.asyncio
 async def test_check_status():
     assert await check_status(1) is True
+
+
+class FakeWorkflowRuntime:
+    """Stands in for the Temporal workflow runtime so RequestWorkflow.run can be driven directly.
+
+    Activities return ``results[name]`` (default True); ``gates[name]`` holds an activity until
+    set; ``hooks[name]`` runs after an activity is called.
+    """
+
+    def __init__(self, results=None, gates=None, hooks=None):
+        self.results = results or {}
+        self.gates = gates or {}
+        self.hooks = hooks or {}
+        self.calls = []
+        self.upserts = []
+        self.handlers = set()
+        self.now = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+    def install(self, monkeypatch):
+        import workflows
+
+        wf = workflows.workflow
+        monkeypatch.setattr(wf, "execute_activity", self.execute_activity)
+        monkeypatch.setattr(wf, "patched", lambda patch_id: True)
+        monkeypatch.setattr(wf, "upsert_search_attributes", self.upserts.extend)
+        monkeypatch.setattr(wf, "now", lambda: self.now)
+        monkeypatch.setattr(wf, "info", lambda: SimpleNamespace(workflow_id="request-1", run_id="run-1"))
+        monkeypatch.setattr(wf, "wait_condition", self.wait_condition)
+        monkeypatch.setattr(wf, "all_handlers_finished", lambda: not self.handlers)
+
+    async def execute_activity(self, fn, arg, **kwargs):
+        name = fn.__name__
+        self.calls.append((name, arg))
+        if name in self.hooks:
+            self.hooks[name](arg)
+        if name in self.gates:
+            await self.gates[name].wait()
+        return self.results.get(name, True)
+
+    async def wait_condition(self, fn, timeout=None):
+        # A timeout "fires" after a few idle turns; otherwise wait up to two seconds
+        for _ in range(20 if timeout is not None else 2000):
+            if fn():
+                return
+            await asyncio.sleep(0.001)
+        if timeout is not None:
+            raise asyncio.TimeoutError()
+        raise AssertionError("wait_condition never satisfied")
+
+    def signal(self, instance, update):
+        task = asyncio.get_running_loop().create_task(instance.request_updated(update))
+        self.handlers.add(task)
+        task.add_done_callback(self.handlers.discard)
+
+    def activity_names(self):
+        return [name for name, _ in self.calls]
+
+
+@pytest.mark.asyncio
+async def test_resolving_update_finishes_its_handler_before_run_returns(monkeypatch):
+    from workflows import RequestWorkflow
+
+    instance = RequestWorkflow()
+    gate = asyncio.Event()
+    runtime = FakeWorkflowRuntime(
+        results={"assign_request": 42},
+        gates={"apply_assignment_update": gate},
+        hooks={"audit_event": lambda _: runtime.signal(instance, {"status": "resolved"})},
+    )
+    runtime.install(monkeypatch)
+    run = asyncio.create_task(instance.run(1, 60))
+    await asyncio.sleep(0.05)
+    # Resolved, but the assignee's open-count update is still in flight
+    assert not run.done()
+    gate.set()
+    await asyncio.wait_for(run, 1)
+    assert ("apply_assignment_update", {
+        "request_id": 1,
+        "old_assignee_id": 42,
+        "old_status": "assigned",
+        "assignee_id": 42,
+        "status": "resolved",
+    }) in runtime.calls
+    assert "escalate" not in runtime.activity_names()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sla_minutes", [0, 90])
+async def test_sla_deadline_search_attribute(monkeypatch, sla_minutes):
+    from workflows import RequestWorkflow
+
+    instance = RequestWorkflow()
+    runtime = FakeWorkflowRuntime(
+        results={"check_status": False},
+        hooks={"audit_event": lambda _: runtime.signal(instance, {"status": "resolved"})},
+    )
+    runtime.install(monkeypatch)
+    await asyncio.wait_for(instance.run(1, sla_minutes), 1)
+    upserted = {u.key.name: u.value for u in runtime.upserts}
+    assert upserted["RequestStatus"] == "resolved"
+    assert upserted["Escalated"] is False
+    if sla_minutes:
+        assert upserted["SlaDeadline"] == datetime(2025, 11, 1, 1, 30, tzinfo=timezone.utc)
+    else:
+        assert "SlaDeadline" not in upserted
+
+
+@pytest.mark.asyncio
+async def test_missing_request_is_audited_and_not_processed(monkeypatch):
+    from workflows import RequestWorkflow
+
+    runtime = FakeWorkflowRuntime(results={"validate_request": False})
+    runtime.install(monkeypatch)
+    await asyncio.wait_for(RequestWorkflow().run(1, 0), 1)
+    assert runtime.activity_names() == ["validate_request", "audit_event"]
+    assert runtime.calls[1][1]["event_type"] == "validation_failed"
@@ -1,5 +1,20 @@
 from temporalio.worker import Worker
-from workflows import RequestWorkflow, validate_request, notify, escalate, check_status, audit_event
+from workflows import (
+    RequestWorkflow,
+    validate_request,
+    notify,
+    escalate,
+    check_status,
+    audit_event,
+    assign_request,
+    apply_assignment_update,
+)
+from assignment import ASSIGNMENT_REFRESH_SECONDS, rebuild_index, refresh_index_forever
+from lanes import LaneRouter, workflow_task_slots
+from search_attributes import ensure_search_attributes
+from profiler import LoopLagMonitor, SamplingProfiler, install_profile_signal
+from secret_provider import get_secret_provider
+from db import close_pool
 import asyncio
 
 async def main():
@@ -21,15 +36,63 @@ async def main():
         raise SystemExit(f"Invalid TEMPORAL_ADDRESS port -> {repr(port)} in {repr(temporal_address)}")
 
     client = await Client.connect(temporal_address, namespace=temporal_namespace)
-    # Start worker for the task queue
-    worker = Worker(
-        client,
-        task_queue="requests-hub",
-        workflows=[RequestWorkflow],
-        activities=[validate_request, notify, escalate, check_status, audit_event],
+    # RequestWorkflow upserts custom search attributes; they must exist in the namespace first
+    try:
+        added = await ensure_search_attributes(client, temporal_namespace)
+        if added:
+            print("Registered search attributes:", ", ".join(added))
+    except Exception as e:
+        print("Warning: could not register search attributes:", e)
+    # One Worker per priority lane, each with its own slot budget, so a saturated low lane
+    # never takes slots from critical work. WORKER_LANES limits which lanes this process polls.
+    lanes = LaneRouter().select(os.getenv("WORKER_LANES", "").split(","))
+    workers = [
+        Worker(
+            client,
+            task_queue=lane.task_queue,
+            workflows=[RequestWorkflow],
+            activities=[
+                validate_request,
+                notify,
+                escalate,
+                check_status,
+                audit_event,
+                assign_request,
+                apply_assignment_update,
+            ],
+            max_concurrent_workflow_tasks=workflow_task_slots(lane.slots),
+            max_concurrent_activities=lane.slots,
+        )
+        for lane in lanes
+    ]
+    # Load per-user open counts and skills once so assignments never scan requests
+    try:
+        await rebuild_index()
+    except Exception as e:
+        print("Warning: could not load assignment index:", e)
+    # Other replicas apply updates to their own copy; reload to pick those up
+    refresh = (
+        asyncio.create_task(refresh_index_forever()) if ASSIGNMENT_REFRESH_SECONDS > 0 else None
     )
-    print("Worker started for task queue: requests-hub")
-    await worker.run()
+    # Keep cached secrets (e.g. the Cosmos connection string) fresh so rotation needs no restart
+    secrets = get_secret_provider()
+    secrets.start()
+    # Log the stack of anything blocking the event loop; `kill -USR1 <pid>` writes a profile
+    loop_lag = LoopLagMonitor()
+    loop_lag.start()
+    install_profile_signal(
+        SamplingProfiler(), float(os.getenv("PROFILE_SECONDS", "30")), prefix="worker"
+    )
+    for lane in lanes:
+        print(f"Worker started for lane {lane.name}: task queue {lane.task_queue}, {lane.slots} slots")
+    try:
+        await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        if refresh is not None:
+            refresh.cancel()
+        await loop_lag.stop()
+        await secrets.close()
+        await close_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,13 +1,30 @@
 from temporalio import workflow, activity
+from temporalio.common import RetryPolicy
 from datetime import timedelta
 import asyncio
 from audit import write_audit_event
+from db import get_pool, load_request, record_escalation
+from assignment import assign, index as assignment_index, recount_for_request
+import search_attributes as attrs
+
+# Patch ids guarding commands added to RequestWorkflow, so histories recorded before them
+# still replay
+ASSIGNMENT_PATCH = "request-auto-assignment"
+SEARCH_ATTRIBUTES_PATCH = "request-search-attributes"
+
+def _request_id(data):
+    # Activities get the request id; older callers passed a dict with "id"
+    return data.get("id") if isinstance(data, dict) else data
 
 @activity.defn
 async def validate_request(data):
-    # Placeholder: validate request data
+    # The request must exist; lookups are batched with concurrent ones (see db.request_loader)
     print(f"Validating request: {data}")
-    return True
+    request_id = _request_id(data)
+    if request_id is None or await get_pool() is None:
+        # No database configured (local runs and tests): nothing to check against
+        return True
+    return await load_request(request_id) is not None
 
 @activity.defn
 async def notify(channel, message=None):
@@ -36,19 +53,90 @@ async def audit_event(payload):
         run_id = payload.get('run_id')
         res = await write_audit_event(request_id, event_type, p, workflow_id=workflow_id, run_id=run_id)
         print(f"Audit event result: {res}")
+        if event_type == "escalated":
+            # Feed the incrementally maintained dashboard counters (request_stats)
+            try:
+                await record_escalation(request_id)
+            except Exception as e:
+                print("Recording escalation stats failed (ignored):", e)
         return res
     except Exception as e:
         print("Audit activity error:", e)
         return {"ok": False, "reason": str(e)}
 
+@activity.defn
+async def assign_request(request_id):
+    # Pick the least-loaded user skilled in the request type; None when nobody is available
+    assignee = await assign(request_id)
+    print(f"Assigned request {request_id} to {assignee}")
+    return assignee
+
+@activity.defn
+async def apply_assignment_update(change):
+    # change: request_id, old_assignee_id, old_status, assignee_id, status (sent by
+    # RequestWorkflow). With a database the counts come from the request row; the workflow's
+    # old assignee misses an auto-assignment that was still in flight when the PATCH arrived.
+    request_id = change.get('request_id')
+    if request_id is not None and await recount_for_request(request_id, change.get('old_assignee_id')):
+        return True
+    assignment_index.apply_update(
+        change.get('old_assignee_id'),
+        change.get('old_status'),
+        change.get('assignee_id'),
+        change.get('status'),
+    )
+    return True
+
 @activity.defn
 async def check_status(request_id):
-    # Placeholder: check if request is still open
+    # Still open unless resolved (or gone); SLA bursts share batched, briefly cached lookups
     print(f"Checking status for {request_id}")
-    return True  # Simulate still open
+    if await get_pool() is None:
+        return True
+    row = await load_request(request_id)
+    return row is not None and row["status"] != "resolved"
 
 @workflow.defn
 class RequestWorkflow:
+    def __init__(self):
+        self.status = "open"
+        self.assignee_id = None
+        self.request_id = None
+
+    def _upsert_search_attributes(self, *updates):
+        # Keeps visibility queries (status, SLA, escalation) answerable without Postgres
+        if workflow.patched(SEARCH_ATTRIBUTES_PATCH):
+            workflow.upsert_search_attributes(list(updates))
+
+    async def _finish(self):
+        # A resolving update ends the run; let its handler's assignment update land first
+        await workflow.wait_condition(workflow.all_handlers_finished)
+
+    @workflow.signal
+    async def request_updated(self, update):
+        # Sent by the API after PATCH; keeps workflow state and the assignment index current
+        old_assignee, old_status = self.assignee_id, self.status
+        self.status = update.get("status", self.status)
+        self.assignee_id = update.get("assignee_id", self.assignee_id)
+        if self.status != old_status:
+            self._upsert_search_attributes(attrs.STATUS.value_set(self.status))
+        if not workflow.patched(ASSIGNMENT_PATCH):
+            return
+        try:
+            await workflow.execute_activity(
+                apply_assignment_update,
+                {
+                    "request_id": self.request_id,
+                    "old_assignee_id": old_assignee,
+                    "old_status": old_status,
+                    "assignee_id": self.assignee_id,
+                    "status": self.status,
+                },
+                start_to_close_timeout=timedelta(seconds=10),
+            )
+        except Exception as e:
+            print("Assignment update failed (ignored):", e)
+
     @workflow.run
     async def run(self, request_id, sla_minutes: int = 120):
         # Normalize inputs: `tctl` sometimes passes a JSON array as a single input
@@ -62,11 +150,56 @@ class RequestWorkflow:
                 # fall back to the provided values
                 pass
 
-        await workflow.execute_activity(
+        self.request_id = request_id
+        try:
+            sla_val = int(sla_minutes)
+        except Exception:
+            sla_val = sla_minutes if isinstance(sla_minutes, int) else 0
+        initial = [attrs.STATUS.value_set(self.status), attrs.ESCALATED.value_set(False)]
+        if sla_val > 0:
+            # No deadline without an SLA, so those workflows never show up as overdue
+            initial.append(attrs.SLA_DEADLINE.value_set(workflow.now() + timedelta(minutes=sla_val)))
+        self._upsert_search_attributes(*initial)
+
+        valid = await workflow.execute_activity(
             validate_request,
             request_id,
             start_to_close_timeout=timedelta(seconds=30),
         )
+        if not valid:
+            # The request row is gone: nothing to assign, notify about or escalate
+            try:
+                await workflow.execute_activity(
+                    audit_event,
+                    {
+                        "request_id": request_id,
+                        "event_type": "validation_failed",
+                        "payload": {"reason": "request not found"},
+                        "workflow_id": workflow.info().workflow_id,
+                        "run_id": workflow.info().run_id,
+                    },
+                    start_to_close_timeout=timedelta(seconds=20),
+                )
+            except Exception as e:
+                print("Audit activity failed (ignored):", e)
+            await self._finish()
+            return
+        # Assign to the least-loaded skilled user unless someone was assigned by hand already
+        if workflow.patched(ASSIGNMENT_PATCH):
+            try:
+                assignee = await workflow.execute_activity(
+                    assign_request,
+                    request_id,
+                    start_to_close_timeout=timedelta(seconds=30),
+                    retry_policy=RetryPolicy(maximum_attempts=3),
+                )
+                if assignee is not None and self.assignee_id is None:
+                    self.assignee_id = assignee
+                    if self.status == "open":
+                        self.status = "assigned"
+                        self._upsert_search_attributes(attrs.STATUS.value_set(self.status))
+            except Exception as e:
+                print("Assignment failed (ignored):", e)
         # notify expects a single input (channel, message) tuple
         await workflow.execute_activity(
             notify,
@@ -89,17 +222,20 @@ class RequestWorkflow:
         except Exception as e:
             print("Audit activity failed (ignored):", e)
         # Avoid creating a zero-length timer (temporal requires a positive StartToFireTimeout)
-        try:
-            sla_val = int(sla_minutes)
-        except Exception:
-            sla_val = sla_minutes if isinstance(sla_minutes, int) else 0
-
         if sla_val > 0:
-            # Use timedelta to produce a proper Duration for the StartTimer command
-            await workflow.sleep(timedelta(seconds=sla_val * 60))
+            # Wait out the SLA, returning early if the request is resolved in the meantime
+            try:
+                await workflow.wait_condition(
+                    lambda: self.status == "resolved", timeout=timedelta(minutes=sla_val)
+                )
+            except asyncio.TimeoutError:
+                pass
         else:
             # immediate path when SLA is 0: proceed to status check without a timer
             pass
+        if self.status == "resolved":
+            await self._finish()
+            return
         still_open = await workflow.execute_activity(
             check_status,
             request_id,
@@ -111,6 +247,7 @@ class RequestWorkflow:
                 request_id,
                 start_to_close_timeout=timedelta(seconds=30),
             )
+            self._upsert_search_attributes(attrs.ESCALATED.value_set(True))
             # record audit: escalated
             try:
                 await workflow.execute_activity(
@@ -126,3 +263,7 @@ class RequestWorkflow:
                 )
             except Exception as e:
                 print("Audit activity failed (ignored):", e)
+            # Stay open until resolved so later updates keep reaching the assignment index
+            if workflow.patched(ASSIGNMENT_PATCH):
+                await workflow.wait_condition(lambda: self.status == "resolved")
+        await self._finish()